@@ -8,9 +8,17 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
+import time
 
 from django.core.asgi import get_asgi_application
 
+boot_started = time.perf_counter()
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
 
 application = get_asgi_application()
+
+from LittleLemonAPI.taskqueue import autostart_workers  # noqa: E402
+from LittleLemonAPI.warmup import warm_up  # noqa: E402
+
+warm_up(boot_started)
+autostart_workers()
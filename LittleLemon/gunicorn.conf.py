@@ -0,0 +1,32 @@
+"""
+Gunicorn configuration for the multi-process settings profile.
+
+    gunicorn -c LittleLemon/gunicorn.conf.py
+
+``WEB_CONCURRENCY`` and ``WEB_THREADS`` override the process and thread
+counts. See LittleLemon/settings_multiprocess.py.
+"""
+import multiprocessing
+import os
+
+wsgi_app = 'LittleLemon.wsgi:application'
+raw_env = ['DJANGO_SETTINGS_MODULE=LittleLemon.settings_multiprocess']
+
+# CPU-bound work scales with processes, database and cache waits with
+# threads; the shared cache keeps the extra processes from running cold.
+# Load shedding runs half the threads and queues requests on the rest
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8))
+
+# Load and warm the app once in the master, then fork
+preload_app = True
+timeout = 30
+
+
+def when_ready(server):
+    # The warm-up queried the database in the master; workers must not
+    # inherit its connections
+    from django.db import connections
+
+    connections.close_all()
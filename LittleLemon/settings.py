@@ -40,6 +40,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'LittleLemonAPI.loadshedding.LoadSheddingMiddleware',
+    'LittleLemonAPI.profiling.ProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -122,6 +124,81 @@ CACHES = {
     }
 }
 
+# Import views/serializers and preload lookup tables when a worker boots
+WARM_UP_ON_BOOT = config('WARM_UP_ON_BOOT', default=True, cast=bool)
+
+# Background task queue (see LittleLemonAPI/taskqueue.py)
+TASK_QUEUE = {
+    'WORKERS': config('TASK_WORKERS', default=2, cast=int),
+    'POLL_INTERVAL': 1.0,  # seconds between polls of an empty queue
+    'BATCH_SIZE': 50,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BACKOFF': 5,  # seconds, doubled on every further attempt
+    'LEASE': 300,  # seconds before a running task is handed out again
+    # Run a worker inside each server process instead of `run_tasks`
+    'AUTOSTART': config('TASK_AUTOSTART', default=False, cast=bool),
+}
+
+# "Most ordered" rankings (see LittleLemonAPI/popularity.py)
+POPULAR_ITEMS = {
+    'MAX_WINDOW': 30,  # days of counters kept in memory
+    'TOP_SIZE': 50,  # longest ranking cached per window and category
+    'REFRESH_INTERVAL': 60,  # seconds before reloading the counters
+}
+
+# `manage.py purge_carts` defaults
+CART_PURGE = {
+    'TTL_HOURS': 72,  # carts untouched for longer are abandoned
+    'BATCH_SIZE': 500,  # customers per delete transaction
+}
+
+# Threads per server process; LittleLemon/gunicorn.conf.py reads the same
+# variable
+WEB_THREADS = config('WEB_THREADS', default=8, cast=int)
+
+# Priority-aware load shedding (see LittleLemonAPI/loadshedding.py)
+LOAD_SHEDDING = {
+    'ENABLED': config('LOAD_SHEDDING', default=True, cast=bool),
+    # Requests running at once per process. The other threads hold queued
+    # requests, so the next free slot goes to the highest class waiting
+    'CAPACITY': config(
+        'LOAD_SHEDDING_CAPACITY', default=max(1, WEB_THREADS // 2), cast=int
+    ),
+    'RESERVE': 1,  # slots of the capacity only the first class may use
+    # Seconds; while the oldest queued request has waited longer, requests
+    # of the last class are shed without queueing
+    'TARGET_WAIT': 0.05,
+    # Classes, highest priority first, and the seconds each may queue
+    'CLASSES': {
+        'critical': 5.0,
+        'normal': 1.0,
+        'low': 0.25,
+    },
+    'DEFAULT_CLASS': 'normal',
+    # URL name -> class, or {method: class} ('*' for any other method)
+    'ROUTES': {
+        'LittleLemonAPI:orders-list': {'POST': 'critical'},
+        'LittleLemonAPI:order-detail': {
+            'PUT': 'critical', 'PATCH': 'critical'
+        },
+        'LittleLemonAPI:delivery-claim': 'critical',
+        'LittleLemonAPI:home': 'low',
+        'LittleLemonAPI:popular-items': 'low',
+        'LittleLemonAPI:menu-items-list': {'GET': 'low'},
+        'LittleLemonAPI:menu-item-detail': {'GET': 'low'},
+        'LittleLemonAPI:delivery-queue': 'low',
+    },
+    'RETRY_AFTER': 1,  # seconds
+}
+
+# On-demand request profiling (see LittleLemonAPI/profiling.py)
+PROFILING = {
+    'SAMPLE_RATE': config('PROFILE_SAMPLE_RATE', default=0.0, cast=float),
+    'DIRECTORY': BASE_DIR / 'profiles',
+    'MAX_PROFILES': 50,
+    'TOKEN_MAX_AGE': 3600,  # seconds
+}
+
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
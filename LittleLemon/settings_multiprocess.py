@@ -0,0 +1,39 @@
+"""
+Settings for serving LittleLemon from several worker processes on one host.
+
+Every worker shares the SQLite cache at ``CACHE_LOCATION`` (see
+LittleLemonAPI/cache.py), so anything one process caches or invalidates is
+seen by all of them. Recommended layouts:
+
+* WSGI: ``gunicorn -c LittleLemon/gunicorn.conf.py``, one process per core
+  with ``WEB_THREADS`` (8) ``gthread`` threads each, half of which run
+  requests while the rest queue for the load shedder. The app is
+  preloaded, so the warm-up in ``wsgi.py`` runs once in the master and is
+  shared by every fork.
+* ASGI: ``uvicorn LittleLemon.asgi:application --workers N`` with ``N``
+  at twice the core count and ``LOAD_SHEDDING_CAPACITY=2``. Under ASGI
+  Django runs all sync views of a process on one thread, so concurrency
+  has to come from processes; a capacity of two leaves one slot for
+  regular traffic and the reserved one for checkouts.
+
+The in-process task worker is disabled, since every server process would
+start one; run ``manage.py run_tasks`` beside the server instead.
+"""
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, TASK_QUEUE, config
+
+CACHES = {
+    'default': {
+        'BACKEND': 'LittleLemonAPI.cache.SQLiteCache',
+        'LOCATION': config(
+            'CACHE_LOCATION', default=str(BASE_DIR / 'cache.sqlite3')
+        ),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'CULL_FREQUENCY': 10,  # evict the least recently read tenth
+        },
+    }
+}
+
+TASK_QUEUE = {**TASK_QUEUE, 'AUTOSTART': False}
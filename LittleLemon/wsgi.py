@@ -8,9 +8,17 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/wsgi/
 """
 
 import os
+import time
 
 from django.core.wsgi import get_wsgi_application
 
+boot_started = time.perf_counter()
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LittleLemon.settings')
 
 application = get_wsgi_application()
+
+from LittleLemonAPI.taskqueue import autostart_workers  # noqa: E402
+from LittleLemonAPI.warmup import warm_up  # noqa: E402
+
+warm_up(boot_started)
+autostart_workers()
@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Category, MenuItem, Cart, Order, OrderItem
+from .models import (
+    Category, MenuItem, Cart, Order, OrderItem, MenuItemDailyCount, Task
+)
 
 # Register your models here.
 admin.site.register(Category)
@@ -7,3 +9,5 @@ admin.site.register(MenuItem)
 admin.site.register(Cart)
 admin.site.register(Order)
 admin.site.register(OrderItem)
+admin.site.register(MenuItemDailyCount)
+admin.site.register(Task)
@@ -0,0 +1,234 @@
+"""
+A cache backend shared by every worker process on one host.
+
+Entries live in a single SQLite file in WAL mode, so readers never block
+each other or the writer, and a value cached by one gunicorn or uvicorn
+worker is a hit in all the others. Deletes and ``clear()`` likewise reach
+every process, which ``LocMemCache`` cannot do.
+
+Each entry has its own expiry time. Once the table grows past
+``MAX_ENTRIES``, expired rows are dropped first, then the least recently
+read ``1 / CULL_FREQUENCY`` of the rest. Reads refresh an entry's access
+time at most once every ``TOUCH_INTERVAL`` seconds, to keep most reads
+free of writes.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'LittleLemonAPI.cache.SQLiteCache',
+            'LOCATION': '/var/tmp/littlelemon-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+TOUCH_INTERVAL = 1.0
+BUSY_TIMEOUT = 5.0
+LIVE = "(expires IS NULL OR expires > ?)"
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS cache (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL,
+        accessed REAL NOT NULL
+    ) WITHOUT ROWID
+    """,
+    "CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)",
+    "CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)",
+]
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.path = location
+        self._local = threading.local()
+
+    def _connection(self):
+        # SQLite connections must not cross threads or a fork
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            connection = sqlite3.connect(
+                self.path,
+                timeout=BUSY_TIMEOUT,
+                isolation_level=None,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    @contextmanager
+    def _write(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _fetch(self, keys):
+        """Live ``{key: value}`` for ``keys``; refreshes access times."""
+        now = time.time()
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._connection().execute(
+            f"SELECT key, value, expires, accessed FROM cache "
+            f"WHERE key IN ({placeholders})",
+            keys,
+        ).fetchall()
+        found, expired, stale = {}, [], []
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires <= now:
+                expired.append(key)
+                continue
+            found[key] = pickle.loads(value)
+            if now - accessed >= TOUCH_INTERVAL:
+                stale.append(key)
+        if expired or stale:
+            with self._write() as connection:
+                connection.executemany(
+                    "DELETE FROM cache WHERE key = ? AND expires <= ?",
+                    [(key, now) for key in expired],
+                )
+                connection.executemany(
+                    "UPDATE cache SET accessed = ? WHERE key = ?",
+                    [(now, key) for key in stale],
+                )
+        return found
+
+    def _store(self, connection, key, value, timeout):
+        connection.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires, accessed) "
+            "VALUES (?, ?, ?, ?)",
+            (
+                key,
+                pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                self.get_backend_timeout(timeout),
+                time.time(),
+            ),
+        )
+
+    def _cull(self, connection):
+        (count,) = connection.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute("DELETE FROM cache")
+            return
+        connection.execute(
+            "DELETE FROM cache WHERE expires <= ?", (time.time(),)
+        )
+        (count,) = connection.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count > self._max_entries:
+            connection.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                (count // self._cull_frequency,),
+            )
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._fetch([key]).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version=version): key
+                for key in keys}
+        if not keys:
+            return {}
+        found = self._fetch(list(keys))
+        return {keys[key]: value for key, value in found.items()}
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            f"SELECT 1 FROM cache WHERE key = ? AND {LIVE}",
+            (key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as connection:
+            self._store(connection, key, value, timeout)
+            self._cull(connection)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._write() as connection:
+            for key, value in data.items():
+                key = self.make_and_validate_key(key, version=version)
+                self._store(connection, key, value, timeout)
+            self._cull(connection)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as connection:
+            if connection.execute(
+                f"SELECT 1 FROM cache WHERE key = ? AND {LIVE}",
+                (key, time.time()),
+            ).fetchone():
+                return False
+            self._store(connection, key, value, timeout)
+            self._cull(connection)
+        return True
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as connection:
+            cursor = connection.execute(
+                f"UPDATE cache SET expires = ? WHERE key = ? AND {LIVE}",
+                (self.get_backend_timeout(timeout), key, time.time()),
+            )
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        # Read and write in one transaction, so concurrent increments from
+        # other processes are never lost
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as connection:
+            row = connection.execute(
+                f"SELECT value FROM cache WHERE key = ? AND {LIVE}",
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found.")
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                "UPDATE cache SET value = ? WHERE key = ?",
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key),
+            )
+        return value
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        with self._write() as connection:
+            cursor = connection.execute(
+                "DELETE FROM cache WHERE key = ?", (key,)
+            )
+        return cursor.rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version)
+                for key in keys]
+        with self._write() as connection:
+            connection.executemany(
+                "DELETE FROM cache WHERE key = ?", [(key,) for key in keys]
+            )
+
+    def clear(self):
+        with self._write() as connection:
+            connection.execute("DELETE FROM cache")
@@ -0,0 +1,115 @@
+"""
+Cross-process cache benchmark.
+
+``run_benchmark()`` starts ``workers`` forked processes per backend, all
+pointed at the same cache location, and has each one run a read-through
+workload: ``get`` a key drawn from a skewed distribution and ``set`` it on
+a miss. A hit on a value another process stored counts as a cross-worker
+hit, which is what a per-process cache can never deliver.
+
+Used by ``manage.py cache_benchmark``.
+"""
+import multiprocessing
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'filebased': 'django.core.cache.backends.filebased.FileBasedCache',
+    'sqlite': 'LittleLemonAPI.cache.SQLiteCache',
+}
+PAYLOAD = 'x' * 512
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[int(fraction * (len(ordered) - 1))] if ordered else 0.0
+
+
+def run_worker(backend, location, worker, operations, keys, seed):
+    cache = import_string(BACKENDS[backend])(
+        location, {'OPTIONS': {'MAX_ENTRIES': keys * 2}}
+    )
+    rng = random.Random(seed + worker)
+    hits = cross_hits = 0
+    get_times, set_times = [], []
+    for _ in range(operations):
+        # Squaring skews lookups towards low keys, like a popular menu
+        key = f'bench:{int(keys * rng.random() ** 2)}'
+        start = time.perf_counter()
+        value = cache.get(key)
+        get_times.append(time.perf_counter() - start)
+        if value is None:
+            start = time.perf_counter()
+            cache.set(key, {'worker': worker, 'payload': PAYLOAD}, 300)
+            set_times.append(time.perf_counter() - start)
+            continue
+        hits += 1
+        if value['worker'] != worker:
+            cross_hits += 1
+    return {
+        'gets': operations,
+        'hits': hits,
+        'cross_hits': cross_hits,
+        'get_times': get_times,
+        'set_times': set_times,
+    }
+
+
+def run_backend(backend, workers, operations, keys, seed):
+    with tempfile.TemporaryDirectory() as directory:
+        location = {
+            'locmem': 'cache-benchmark',
+            'filebased': directory,
+            'sqlite': str(Path(directory) / 'cache.sqlite3'),
+        }[backend]
+        # Forked workers inherit the configured Django settings
+        context = multiprocessing.get_context('fork')
+        with context.Pool(workers) as pool:
+            results = pool.starmap(run_worker, [
+                (backend, location, worker, operations, keys, seed)
+                for worker in range(workers)
+            ])
+
+    gets = sum(result['gets'] for result in results)
+    get_times = [t for result in results for t in result['get_times']]
+    set_times = [t for result in results for t in result['set_times']]
+    return {
+        'backend': backend,
+        'hit_rate': sum(result['hits'] for result in results) / gets,
+        'cross_hit_rate': (
+            sum(result['cross_hits'] for result in results) / gets
+        ),
+        'get_mean_us': sum(get_times) / len(get_times) * 1e6,
+        'get_p95_us': percentile(get_times, 0.95) * 1e6,
+        'set_mean_us': (
+            sum(set_times) / len(set_times) * 1e6 if set_times else 0.0
+        ),
+    }
+
+
+def run_benchmark(backends=None, workers=4, operations=5000, keys=1000,
+                  seed=0):
+    return [
+        run_backend(backend, workers, operations, keys, seed)
+        for backend in backends or BACKENDS
+    ]
+
+
+def format_report(rows):
+    lines = [
+        f"{'backend':<10} {'hit rate':>9} {'cross-worker':>13} "
+        f"{'get mean':>10} {'get p95':>10} {'set mean':>10}"
+    ]
+    for row in rows:
+        lines.append(
+            f"{row['backend']:<10} {row['hit_rate']:>9.1%} "
+            f"{row['cross_hit_rate']:>13.1%} "
+            f"{row['get_mean_us']:>8.1f}us {row['get_p95_us']:>8.1f}us "
+            f"{row['set_mean_us']:>8.1f}us"
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,73 @@
+"""
+Conditional GET support for the API views.
+
+Validators are built from ``updated_at`` columns and row counts only, so a
+request carrying a matching ``If-None-Match`` (or ``If-Modified-Since`` for
+single resources) is answered with ``304 Not Modified`` before any
+serializer work happens.
+"""
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def collection_version(queryset, *timestamp_fields):
+    """
+    Return ``(count, last_modified)`` for ``queryset``.
+
+    Inserts and updates move the newest ``updated_at`` forward and deletes
+    lower the count, so the pair changes whenever the collection does.
+    """
+    aggregates = {'count': Count('pk')}
+    for index, field in enumerate(timestamp_fields):
+        aggregates[f'modified_{index}'] = Max(field)
+    result = queryset.order_by().aggregate(**aggregates)
+    count = result.pop('count')
+    stamps = [stamp for stamp in result.values() if stamp is not None]
+    return count, max(stamps, default=None)
+
+
+def make_etag(request, *parts):
+    """Hash the version ``parts`` together with the negotiated format."""
+    renderer = getattr(request, 'accepted_renderer', None)
+    parts = (getattr(renderer, 'format', ''),) + parts
+    raw = ':'.join(str(part) for part in parts)
+    return hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()
+
+
+class ConditionalGetMixin:
+    """
+    Answer conditional GETs with ``304 Not Modified``.
+
+    Views implement ``get_validators()`` returning ``(etag, last_modified)``;
+    either may be ``None``. It runs after authentication and permission
+    checks but before the queryset is fetched or serialized. Collections
+    should only return an ETag: ``Last-Modified`` cannot express deletes.
+    """
+
+    def get_validators(self):
+        raise NotImplementedError(
+            f"{type(self).__name__} must implement get_validators()"
+        )
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        if etag is None and last_modified is None:
+            return super().get(request, *args, **kwargs)
+
+        etag = quote_etag(etag) if etag else None
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(
+            request, etag=etag, last_modified=timestamp
+        )
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if response.status_code not in (200, 304):
+            return response
+        if etag:
+            response.headers.setdefault('ETag', etag)
+        if timestamp is not None:
+            response.headers.setdefault('Last-Modified', http_date(timestamp))
+        return response
@@ -0,0 +1,207 @@
+"""
+Priority-aware load shedding.
+
+Every request is mapped to a priority class from its URL name and method
+(``LOAD_SHEDDING['ROUTES']``). All classes share one budget of
+``CAPACITY`` requests running at once per process, of which ``RESERVE``
+slots are kept for the highest class, so checkouts and delivery updates
+always find room however many menu reads are in flight.
+
+Requests over the budget queue here rather than in the server: it runs
+more threads than ``CAPACITY`` (see LittleLemon/gunicorn.conf.py), so the
+waiting requests are visible and the next free slot goes to the highest
+class waiting, oldest first. Each class queues for at most its
+``CLASSES`` wait; the lowest class is shed at once while the oldest
+queued request has waited longer than ``TARGET_WAIT``. Rejected requests
+get ``503`` with ``Retry-After``. Queue waits and shed counts are exposed
+by ``LoadSheddingStatsView``.
+"""
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import (
+    iscoroutinefunction, markcoroutinefunction, sync_to_async
+)
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
+from django.urls import Resolver404, resolve
+
+# The middleware of this process, for the stats endpoint
+shedder = None
+
+
+def shedding_setting(name):
+    return settings.LOAD_SHEDDING.get(name)
+
+
+class PriorityClass:
+    def __init__(self, name, rank, max_wait):
+        self.name = name
+        self.rank = rank
+        self.max_wait = max_wait
+        self.queue = deque()
+        self.admitted = 0
+        self.shed = 0
+        self.wait_seconds = 0.0
+
+    def stats(self):
+        return {
+            'max_wait': self.max_wait,
+            'waiting': len(self.queue),
+            'admitted': self.admitted,
+            'shed': self.shed,
+            'wait_seconds': round(self.wait_seconds, 3),
+        }
+
+
+class LoadShedder:
+    def __init__(self, capacity, reserve, target_wait, classes, routes,
+                 default_class):
+        self.capacity = capacity
+        self.reserve = reserve
+        self.target_wait = target_wait
+        self.ranked = [
+            PriorityClass(name, rank, max_wait)
+            for rank, (name, max_wait) in enumerate(classes.items())
+        ]
+        self.classes = {cls.name: cls for cls in self.ranked}
+        self.routes = routes
+        self.default = self.classes[default_class]
+        self.active = 0
+        self._changed = threading.Condition()
+
+    @classmethod
+    def from_settings(cls):
+        return cls(
+            shedding_setting('CAPACITY'),
+            shedding_setting('RESERVE'),
+            shedding_setting('TARGET_WAIT'),
+            shedding_setting('CLASSES'),
+            shedding_setting('ROUTES'),
+            shedding_setting('DEFAULT_CLASS'),
+        )
+
+    def classify(self, resolver_match, method):
+        route = None
+        if resolver_match is not None:
+            route = self.routes.get(resolver_match.view_name)
+        if isinstance(route, dict):
+            route = route.get(method, route.get('*'))
+        return self.classes[route] if route else self.default
+
+    def limit(self, priority):
+        if priority is self.ranked[0]:
+            return self.capacity
+        return self.capacity - self.reserve
+
+    def queue_wait(self, now):
+        """How long the oldest queued request has been waiting."""
+        oldest = [cls.queue[0][0] for cls in self.ranked if cls.queue]
+        return now - min(oldest) if oldest else 0.0
+
+    def _may_run(self, priority, entry):
+        if self.active >= self.limit(priority):
+            return False
+        # A free slot goes to higher classes that can use it first
+        for other in self.ranked[:priority.rank]:
+            if other.queue and self.active < self.limit(other):
+                return False
+        return priority.queue[0] is entry
+
+    def acquire(self, priority):
+        """Take a slot for ``priority``, queueing if needed; False if shed."""
+        with self._changed:
+            arrived = time.monotonic()
+            entry = (arrived, object())
+            priority.queue.append(entry)
+            try:
+                if not self._may_run(priority, entry) and (
+                    priority is self.ranked[-1]
+                    and self.queue_wait(arrived) > self.target_wait
+                ):
+                    priority.shed += 1
+                    return False
+                deadline = arrived + priority.max_wait
+                while not self._may_run(priority, entry):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        priority.shed += 1
+                        return False
+                    self._changed.wait(remaining)
+                self.active += 1
+                priority.admitted += 1
+                priority.wait_seconds += time.monotonic() - arrived
+                return True
+            finally:
+                priority.queue.remove(entry)
+                self._changed.notify_all()
+
+    def release(self):
+        with self._changed:
+            self.active -= 1
+            self._changed.notify_all()
+
+    def stats(self):
+        with self._changed:
+            return {
+                'capacity': self.capacity,
+                'reserve': self.reserve,
+                'active': self.active,
+                'queue_wait': round(self.queue_wait(time.monotonic()), 3),
+                'classes': {cls.name: cls.stats() for cls in self.ranked},
+            }
+
+
+class LoadSheddingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        global shedder
+        if not shedding_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.retry_after = shedding_setting('RETRY_AFTER')
+        self.shedder = shedder = LoadShedder.from_settings()
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        priority = self.classify(request)
+        if not self.shedder.acquire(priority):
+            return self.reject()
+        try:
+            return self.get_response(request)
+        finally:
+            self.shedder.release()
+
+    async def __acall__(self, request):
+        # Queue on a worker thread: under ASGI the sync views share one
+        # thread, which a waiting request must not hold
+        priority = self.classify(request)
+        acquire = sync_to_async(self.shedder.acquire, thread_sensitive=False)
+        if not await acquire(priority):
+            return self.reject()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.shedder.release()
+
+    def classify(self, request):
+        try:
+            resolver_match = resolve(request.path_info)
+        except Resolver404:
+            resolver_match = None
+        return self.shedder.classify(resolver_match, request.method)
+
+    def reject(self):
+        response = JsonResponse(
+            {"detail": "Server is busy, please retry later"},
+            status=503
+        )
+        response.headers['Retry-After'] = str(self.retry_after)
+        return response
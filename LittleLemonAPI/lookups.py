@@ -0,0 +1,96 @@
+"""
+Small, rarely changing tables kept in process memory.
+
+Filled by the boot-time warm-up (see ``warmup``) or on first use. Each
+table remembers the ``versions`` token it was built from and is dropped
+as soon as the token changes, which ``signals`` arrange on every write
+from any process. A miss always falls back to the database.
+"""
+from django.contrib.auth.models import Group, User
+
+from . import versions
+from .models import Category
+
+_group_ids = {}
+_category_ids = None
+_tokens = {}
+
+
+def check(table, clear):
+    """Drop ``table`` if it was built from an older version."""
+    token = versions.current(table)
+    if table not in _tokens or _tokens[table] != token:
+        clear()
+        _tokens[table] = token
+
+
+def group_id(name):
+    """Return the id of the group called ``name``, or ``None``."""
+    check('groups', clear_groups)
+    if name not in _group_ids:
+        pk = Group.objects.filter(name=name).values_list(
+            'pk', flat=True
+        ).first()
+        if pk is None:
+            return None
+        _group_ids[name] = pk
+    return _group_ids[name]
+
+
+def get_group(name):
+    """Like ``Group.objects.get(name=name)`` without the query."""
+    pk = group_id(name)
+    if pk is None:
+        raise Group.DoesNotExist(f"Group {name!r} does not exist")
+    return Group(pk=pk, name=name)
+
+
+def group_members(name):
+    """Users in the group called ``name``, filtered by id, not by name."""
+    pk = group_id(name)
+    if pk is None:
+        return User.objects.none()
+    return User.objects.filter(groups=pk)
+
+
+def category_ids():
+    global _category_ids
+    check('categories', clear_categories)
+    if _category_ids is None:
+        _category_ids = frozenset(
+            Category.objects.values_list('pk', flat=True)
+        )
+    return _category_ids
+
+
+def category_exists(pk):
+    if pk in category_ids():
+        return True
+    if Category.objects.filter(pk=pk).exists():
+        clear_categories()
+        return True
+    return False
+
+
+def clear_groups():
+    _group_ids.clear()
+
+
+def clear_categories():
+    global _category_ids
+    _category_ids = None
+
+
+def clear():
+    clear_groups()
+    clear_categories()
+    _tokens.clear()
+
+
+def load():
+    """Fill every lookup table; called by the warm-up."""
+    clear()
+    check('groups', clear_groups)
+    for name, pk in Group.objects.values_list('name', 'pk'):
+        _group_ids[name] = pk
+    category_ids()
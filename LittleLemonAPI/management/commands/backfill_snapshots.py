@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from LittleLemonAPI.models import Order
+from LittleLemonAPI.snapshots import write_snapshots
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the snapshot of every order placed before snapshots "
+        "existed. Orders are processed in batches, one short transaction "
+        "each, so the command can run while the API serves orders."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=200,
+            help="Orders per transaction.",
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only report how many orders lack a snapshot.",
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        missing = Order.objects.filter(snapshot__isnull=True).order_by('pk')
+        if options['dry_run']:
+            self.stdout.write(
+                f"{missing.count()} order(s) without a snapshot."
+            )
+            return
+
+        total = 0
+        while True:
+            with transaction.atomic():
+                batch = list(missing[:options['batch_size']])
+                if not batch:
+                    break
+                write_snapshots(batch)
+            total += len(batch)
+        self.stdout.write(f"Wrote {total} order snapshot(s).")
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.cachebench import BACKENDS, format_report, run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare cross-worker hit rates and lookup latency of the shared "
+        "SQLite cache with LocMemCache and FileBasedCache, using forked "
+        "worker processes that share one cache location."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backend',
+            action='append',
+            choices=list(BACKENDS),
+            help="Backend to run; repeat for several (default: all).",
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help="Worker processes per backend.",
+        )
+        parser.add_argument(
+            '--operations',
+            type=int,
+            default=5000,
+            help="Lookups per worker.",
+        )
+        parser.add_argument(
+            '--keys',
+            type=int,
+            default=1000,
+            help="Size of the key space.",
+        )
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rows = run_benchmark(
+            backends=options['backend'],
+            workers=options['workers'],
+            operations=options['operations'],
+            keys=options['keys'],
+            seed=options['seed'],
+        )
+        self.stdout.write(format_report(rows))
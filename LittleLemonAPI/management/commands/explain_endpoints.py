@@ -0,0 +1,58 @@
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from LittleLemonAPI.queryplans import (
+    DEFAULT_THRESHOLD, endpoint_cases, format_report, seed
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Print EXPLAIN QUERY PLAN for every filter and ordering option of "
+        "the list endpoints. Everything runs in a transaction that is "
+        "rolled back, so --seed is safe on any database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            action='store_true',
+            help="Add a synthetic dataset before explaining.",
+        )
+        parser.add_argument(
+            '--threshold',
+            type=int,
+            default=DEFAULT_THRESHOLD,
+            help="Flag scans and sorts of tables larger than this.",
+        )
+        parser.add_argument(
+            '--fail',
+            action='store_true',
+            help="Exit with an error when any plan is flagged.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed']:
+                seed()
+            manager = User.objects.create(username='explain-endpoints')
+            Group.objects.get_or_create(name='Manager')[0].user_set.add(
+                manager
+            )
+            cases = list(endpoint_cases(manager, options['threshold']))
+            transaction.set_rollback(True)
+
+        self.stdout.write(format_report(cases))
+        flagged = [case for case in cases if case.problems]
+        self.stdout.write(
+            f"\n{len(cases)} plan(s), {len(flagged)} flagged "
+            f"(threshold {options['threshold']} rows)."
+        )
+        if flagged and options['fail']:
+            raise CommandError(
+                '\n'.join(
+                    f"{case.label}: {problem}"
+                    for case in flagged for problem in case.problems
+                )
+            )
@@ -0,0 +1,132 @@
+import datetime
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from LittleLemonAPI.models import Cart, MenuItemDailyCount
+from LittleLemonAPI.popularity import popularity_setting
+
+
+def purge_setting(name):
+    return settings.CART_PURGE.get(name)
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete carts idle for longer than the TTL, plus popular items "
+        "counters older than the longest ranking window. Rows are deleted "
+        "in small batches, one short transaction each, so the command can "
+        "run while the API serves checkouts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl-hours',
+            type=float,
+            default=purge_setting('TTL_HOURS'),
+            help="Purge carts whose newest line is older than this.",
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=purge_setting('BATCH_SIZE'),
+            help="Customers (or counter rows) handled per transaction.",
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help="Seconds to sleep between batches.",
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Only report what would be purged.",
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+        self.batch_size = options['batch_size']
+        self.pause = options['pause']
+        dry_run = options['dry_run']
+        cutoff = timezone.now() - datetime.timedelta(
+            hours=options['ttl_hours']
+        )
+        oldest_day = datetime.date.today() - datetime.timedelta(
+            days=popularity_setting('MAX_WINDOW') - 1
+        )
+
+        start = time.perf_counter()
+        carts, lines = self.purge_carts(cutoff, dry_run)
+        counters = self.purge_counters(oldest_day, dry_run)
+        elapsed = time.perf_counter() - start
+
+        verb = "Would purge" if dry_run else "Purged"
+        self.stdout.write(
+            f"{verb} {lines} cart line(s) from {carts} idle cart(s) and "
+            f"{counters} expired popularity counter(s) in {elapsed:.2f}s."
+        )
+
+    def idle_users(self, cutoff):
+        return (
+            Cart.objects.values('user')
+            .annotate(last_modified=Max('updated_at'))
+            .filter(last_modified__lt=cutoff)
+            .order_by('user')
+            .values_list('user', flat=True)
+        )
+
+    def purge_carts(self, cutoff, dry_run):
+        if dry_run:
+            idle = self.idle_users(cutoff)
+            return idle.count(), Cart.objects.filter(user__in=idle).count()
+
+        carts = lines = 0
+        while True:
+            users = list(self.idle_users(cutoff)[:self.batch_size])
+            if not users:
+                break
+            with transaction.atomic():
+                # Spare carts a customer touched since the batch was picked
+                active = Cart.objects.filter(
+                    user__in=users, updated_at__gte=cutoff
+                ).values('user')
+                deleted, _ = Cart.objects.filter(user__in=users).exclude(
+                    user__in=active
+                ).delete()
+                kept = set(Cart.objects.filter(
+                    user__in=users
+                ).values_list('user', flat=True))
+            carts += len(set(users) - kept)
+            lines += deleted
+            self.sleep()
+        return carts, lines
+
+    def purge_counters(self, oldest_day, dry_run):
+        expired = MenuItemDailyCount.objects.filter(day__lt=oldest_day)
+        if dry_run:
+            return expired.count()
+
+        total = 0
+        while True:
+            batch = list(expired.values_list('pk', flat=True)[
+                :self.batch_size
+            ])
+            if not batch:
+                break
+            with transaction.atomic():
+                deleted, _ = MenuItemDailyCount.objects.filter(
+                    pk__in=batch
+                ).delete()
+            total += deleted
+            self.sleep()
+        return total
+
+    def sleep(self):
+        if self.pause:
+            time.sleep(self.pause)
@@ -0,0 +1,43 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from LittleLemonAPI.taskqueue import TaskWorker, queue_setting, run_pending
+
+
+class Command(BaseCommand):
+    help = "Run the background task queue worker."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=queue_setting('WORKERS'),
+            help="Number of worker threads.",
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Run the tasks that are due now and exit.",
+        )
+
+    def handle(self, *args, **options):
+        if options['once']:
+            count = 0
+            while processed := run_pending():
+                count += processed
+            self.stdout.write(f"Processed {count} task(s).")
+            return
+
+        worker = TaskWorker(workers=options['workers'])
+
+        def stop(*args):
+            worker.stop()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        self.stdout.write(
+            f"Task worker started with {worker.workers} thread(s)."
+        )
+        worker.run()
+        self.stdout.write("Task worker stopped.")
@@ -1,10 +1,22 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+def menuitem_price(line):
+    """Price of ``line``'s menu item, from the price index unless loaded."""
+    if line._meta.get_field('menuitem').is_cached(line):
+        return line.menuitem.price
+    # Imported here: the price index itself depends on these models
+    from .priceindex import menu_prices
+    price = menu_prices.price(line.menuitem_id)
+    return line.menuitem.price if price is None else price
 
 
 class Category(models.Model):
     slug = models.SlugField(unique=True)
     title = models.CharField(max_length=255, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return self.title
@@ -13,15 +25,59 @@ class Category(models.Model):
         verbose_name_plural = "categories"
 
 
+class MenuItemQuerySet(models.QuerySet):
+    """Bulk writes send no model signals, so they bump the menu here."""
+
+    def bump_version(self):
+        # Imported here: versions itself depends on these models
+        from . import versions
+        versions.bump('menu')
+
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        self.bump_version()
+        return rows
+
+    def bulk_create(self, *args, **kwargs):
+        objs = super().bulk_create(*args, **kwargs)
+        self.bump_version()
+        return objs
+
+    def bulk_update(self, *args, **kwargs):
+        rows = super().bulk_update(*args, **kwargs)
+        self.bump_version()
+        return rows
+
+
 class MenuItem(models.Model):
     title = models.CharField(max_length=255, db_index=True)
     price = models.DecimalField(max_digits=6, decimal_places=2, db_index=True)
     featured = models.BooleanField(db_index=True, default=False)
     category = models.ForeignKey(Category, on_delete=models.PROTECT)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = MenuItemQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.title} ({self.category.title})"
 
+    class Meta:
+        indexes = [
+            # Filter + ordering combinations of MenuItemsListCreateView
+            models.Index(
+                fields=['category', 'title'],
+                name='menuitem_category_title_idx'
+            ),
+            models.Index(
+                fields=['category', 'price'],
+                name='menuitem_category_price_idx'
+            ),
+            models.Index(
+                fields=['price', 'title'],
+                name='menuitem_price_title_idx'
+            ),
+        ]
+
 
 class Cart(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -29,6 +85,7 @@ class Cart(models.Model):
     quantity = models.SmallIntegerField(default=1)
     unit_price = models.DecimalField(max_digits=6, decimal_places=2)
     price = models.DecimalField(max_digits=6, decimal_places=2)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return (
@@ -36,8 +93,11 @@ class Cart(models.Model):
                 for {self.user.username}"
         )
 
-    def save(self, *args, **kwargs):
-        self.unit_price = self.menuitem.price
+    def save(self, *args, unit_price=None, **kwargs):
+        # unit_price: the item's price, if the caller already looked it up
+        if unit_price is None:
+            unit_price = menuitem_price(self)
+        self.unit_price = unit_price
         self.price = self.unit_price * self.quantity
         super().save(*args, **kwargs)
 
@@ -66,12 +126,39 @@ class Order(models.Model):
     status = models.BooleanField(
         db_index=True, default=0
     )  # 0 = out for delivery, 1 = delivered
-    total = models.DecimalField(max_digits=6, decimal_places=2)
+    total = models.DecimalField(
+        max_digits=6, decimal_places=2, db_index=True
+    )
     date = models.DateField(db_index=True, auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Rendered order with its lines as placed; see snapshots.py
+    snapshot = models.JSONField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return f"Order {self.id} by {self.user.username} on {self.date}"
 
+    def save(self, *args, **kwargs):
+        if self.snapshot is not None:
+            # Status and crew are the only fields that change after checkout
+            self.snapshot.update(
+                status=bool(self.status),
+                delivery_crew=self.delivery_crew_id
+            )
+        super().save(*args, **kwargs)
+
+    class Meta:
+        indexes = [
+            # Serves each courier's orders and the unassigned work queue
+            models.Index(
+                fields=['delivery_crew', 'status', 'date'],
+                name='order_crew_status_date_idx'
+            ),
+            models.Index(
+                fields=['date', 'total'],
+                name='order_date_total_idx'
+            ),
+        ]
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE)
@@ -86,7 +173,7 @@ class OrderItem(models.Model):
         )
 
     def save(self, *args, **kwargs):
-        self.unit_price = self.menuitem.price
+        self.unit_price = menuitem_price(self)
         self.price = self.unit_price * self.quantity
         super().save(*args, **kwargs)
 
@@ -101,3 +188,63 @@ class OrderItem(models.Model):
                 name='orderitem_quantity_gte_1'
             ),  # Unique name
         ]
+
+
+class MenuItemDailyCount(models.Model):
+    menuitem = models.ForeignKey(MenuItem, on_delete=models.CASCADE)
+    day = models.DateField()
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.menuitem_id} ordered {self.count} x on {self.day}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'menuitem'],
+                name='unique_menuitem_day'
+            ),
+        ]
+
+
+class Task(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    claimed_by = models.CharField(max_length=64, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['status', 'run_at'],
+                name='task_status_run_at_idx'
+            ),
+        ]
+
+
+class CacheVersion(models.Model):
+    """Version token of a table mirrored in process memory."""
+    name = models.CharField(max_length=50, primary_key=True)
+    token = models.CharField(max_length=32)
+
+    def __str__(self):
+        return f"{self.name} @ {self.token}"
@@ -0,0 +1,113 @@
+"""
+"Most ordered" rankings without scanning ``OrderItem``.
+
+Checkout enqueues the quantities it sold; the ``record_item_orders`` task
+adds them to per-day ``MenuItemDailyCount`` rows. Every process keeps the
+counters for the last ``MAX_WINDOW`` days in a ``PopularityIndex`` and
+caches a top-N list per window and category. The index is rebuilt from
+the counters at boot, after this process records new counts, and every
+``REFRESH_INTERVAL`` seconds, so counts recorded by other processes show
+up within that interval.
+"""
+import datetime
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .models import MenuItemDailyCount
+
+
+def popularity_setting(name):
+    return settings.POPULAR_ITEMS.get(name)
+
+
+class PopularityIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._days = {}
+        self._categories = {}
+        self._top = {}
+        self._loaded_at = None
+
+    def rebuild(self):
+        today = datetime.date.today()
+        since = today - datetime.timedelta(
+            days=popularity_setting('MAX_WINDOW') - 1
+        )
+        days = {}
+        categories = {}
+        rows = MenuItemDailyCount.objects.filter(day__gte=since).values_list(
+            'day', 'menuitem_id', 'count', 'menuitem__category_id'
+        )
+        for day, menuitem_id, count, category_id in rows:
+            days.setdefault(day, Counter())[menuitem_id] = count
+            categories[menuitem_id] = category_id
+        with self._lock:
+            self._days = days
+            self._categories = categories
+            self._top = {}
+            self._loaded_at = time.monotonic()
+
+    def is_stale(self):
+        return (
+            self._loaded_at is None
+            or time.monotonic() - self._loaded_at
+            > popularity_setting('REFRESH_INTERVAL')
+        )
+
+    def invalidate(self):
+        """Rebuild from the counters on the next lookup."""
+        with self._lock:
+            self._loaded_at = None
+
+    def top(self, window, category=None, limit=10):
+        """Return ``[(menuitem_id, count), ...]`` for the last ``window``
+        days, optionally restricted to one category."""
+        if self.is_stale():
+            self.rebuild()
+        today = datetime.date.today()
+        key = (today, window, category)
+        ranking = self._top.get(key)
+        if ranking is None:
+            with self._lock:
+                totals = Counter()
+                for offset in range(window):
+                    day = today - datetime.timedelta(days=offset)
+                    totals.update(self._days.get(day, {}))
+                if category is not None:
+                    totals = Counter({
+                        pk: count for pk, count in totals.items()
+                        if self._categories.get(pk) == category
+                    })
+                ranking = totals.most_common(popularity_setting('TOP_SIZE'))
+                self._top[key] = ranking
+        return ranking[:limit]
+
+
+index = PopularityIndex()
+
+
+def record_orders(payloads):
+    """Apply merged checkout payloads to the counters and local index."""
+    totals = Counter()
+    for payload in payloads:
+        day = datetime.date.fromisoformat(payload['day'])
+        for menuitem_id, quantity in payload['items'].items():
+            totals[(day, int(menuitem_id))] += quantity
+
+    for (day, menuitem_id), quantity in totals.items():
+        updated = MenuItemDailyCount.objects.filter(
+            day=day, menuitem_id=menuitem_id
+        ).update(count=F('count') + quantity)
+        if not updated:
+            MenuItemDailyCount.objects.create(
+                day=day, menuitem_id=menuitem_id, count=quantity
+            )
+
+    # Reloading rather than adding the totals in memory: a rebuild that
+    # already saw this commit would otherwise count them twice
+    transaction.on_commit(index.invalidate)
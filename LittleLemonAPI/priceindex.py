@@ -0,0 +1,66 @@
+"""
+Process-wide menu price index.
+
+Menu item ids and prices (in cents) live in two parallel ``array('q')``
+columns sorted by id, so resolving the prices of a whole cart is a few
+binary searches instead of a query per line. Every write to ``MenuItem``
+bumps the ``menu`` token in ``versions``: single rows through the signal
+receivers, ``update()``, ``bulk_create()`` and ``bulk_update()`` through
+``MenuItemQuerySet``. Lookups compare that token, read at most once per
+request, with the one the index was built from and reload on any
+difference, so writes from every process are picked up.
+"""
+import threading
+from array import array
+from bisect import bisect_left
+from decimal import Decimal
+
+from . import versions
+from .models import MenuItem
+
+
+class MenuPriceIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._columns = (array('q'), array('q'))
+        self._loaded = False
+        self._token = None
+
+    def load(self):
+        # Read the token first: a write racing the load bumps it again
+        token = versions.current('menu')
+        ids, cents = array('q'), array('q')
+        for pk, price in MenuItem.objects.order_by('pk').values_list(
+            'pk', 'price'
+        ):
+            ids.append(pk)
+            cents.append(int(price * 100))
+        with self._lock:
+            self._columns = (ids, cents)
+            self._token = token
+            self._loaded = True
+
+    def columns(self):
+        """The ``(ids, cents)`` arrays, reloaded if the menu changed."""
+        if not self._loaded or versions.current('menu') != self._token:
+            self.load()
+        return self._columns
+
+    def prices(self, ids):
+        """Map each existing id in ``ids`` to its price."""
+        item_ids, cents = self.columns()
+        found = {}
+        for pk in ids:
+            position = bisect_left(item_ids, pk)
+            if position < len(item_ids) and item_ids[position] == pk:
+                found[pk] = Decimal(cents[position]).scaleb(-2)
+        return found
+
+    def price(self, pk):
+        return self.prices([pk]).get(pk)
+
+    def exists(self, pk):
+        return pk in self.prices([pk])
+
+
+menu_prices = MenuPriceIndex()
@@ -0,0 +1,168 @@
+"""
+On-demand request profiling.
+
+A request is profiled when it carries a valid profiling token, either in
+the ``X-Profile-Token`` header or as ``?profile=<token>``, or when it is
+picked by ``PROFILING['SAMPLE_RATE']``. Tokens are signed and short-lived;
+managers obtain one from ``ProfileTokenView``.
+
+Each profile is a cProfile dump plus a JSON summary with the SQL log and
+timings, kept in a bounded ring of files in ``PROFILING['DIRECTORY']``.
+Requests that are not profiled only pay for a header lookup and a
+substring test on the query string.
+"""
+import cProfile
+import io
+import json
+import logging
+import pstats
+import random
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.db import connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SALT = 'LittleLemonAPI.profiling'
+
+
+def profiling_setting(name):
+    return settings.PROFILING.get(name)
+
+
+def issue_token(user):
+    return signing.dumps({'user': user.pk}, salt=TOKEN_SALT)
+
+
+def check_token(token):
+    try:
+        signing.loads(
+            token,
+            salt=TOKEN_SALT,
+            max_age=profiling_setting('TOKEN_MAX_AGE'),
+        )
+    except signing.BadSignature:
+        return False
+    return True
+
+
+class ProfileStore:
+    """A directory holding at most ``max_profiles`` profiles."""
+
+    def __init__(self, directory=None, max_profiles=None):
+        self.directory = Path(directory or profiling_setting('DIRECTORY'))
+        self.max_profiles = max_profiles or profiling_setting('MAX_PROFILES')
+
+    def save(self, profiler, summary):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = (
+            f"{timezone.now():%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}"
+        )
+        summary['name'] = name
+        profiler.dump_stats(self.directory / f"{name}.prof")
+        with open(self.directory / f"{name}.json", 'w') as fp:
+            json.dump(summary, fp, indent=2, default=str)
+        self.prune()
+        return name
+
+    def prune(self):
+        for path in self.summaries()[self.max_profiles:]:
+            path.unlink(missing_ok=True)
+            path.with_suffix('.prof').unlink(missing_ok=True)
+
+    def summaries(self):
+        """Summary files, newest first."""
+        if not self.directory.is_dir():
+            return []
+        return sorted(self.directory.glob('*.json'), reverse=True)
+
+    def list(self):
+        profiles = []
+        for path in self.summaries():
+            try:
+                with open(path) as fp:
+                    summary = json.load(fp)
+            except (OSError, ValueError):
+                continue
+            summary.pop('queries', None)
+            summary.pop('top_functions', None)
+            profiles.append(summary)
+        return profiles
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = profiling_setting('SAMPLE_RATE')
+
+    def __call__(self, request):
+        reason = self.profile_reason(request)
+        if reason is None:
+            return self.get_response(request)
+        return self.profile(request, reason)
+
+    def profile_reason(self, request):
+        token = request.META.get('HTTP_X_PROFILE_TOKEN')
+        if token is None and 'profile=' in request.META.get(
+            'QUERY_STRING', ''
+        ):
+            token = request.GET.get('profile')
+        if token is not None:
+            return 'token' if check_token(token) else None
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sampled'
+        return None
+
+    def profile(self, request, reason):
+        queries = []
+
+        def log_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append({
+                    'alias': context['connection'].alias,
+                    'sql': sql,
+                    'time_ms': (time.perf_counter() - start) * 1000,
+                })
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(log_query))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        duration = (time.perf_counter() - start) * 1000
+
+        stats = io.StringIO()
+        pstats.Stats(profiler, stream=stats).sort_stats(
+            'cumulative'
+        ).print_stats(25)
+        summary = {
+            'created': timezone.now().isoformat(),
+            'reason': reason,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'duration_ms': round(duration, 3),
+            'query_count': len(queries),
+            'query_time_ms': round(sum(q['time_ms'] for q in queries), 3),
+            'queries': queries,
+            'top_functions': stats.getvalue(),
+        }
+        try:
+            ProfileStore().save(profiler, summary)
+        except OSError:
+            logger.exception("Could not save profile for %s", request.path)
+        return response
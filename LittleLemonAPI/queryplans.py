@@ -0,0 +1,180 @@
+"""
+Query-plan checks for the list endpoints' filter and ordering options.
+
+``endpoint_cases()`` enumerates every ``filterset_fields`` x
+``ordering_fields`` combination of the list views, builds the queryset the
+view would paginate and captures SQLite's ``EXPLAIN QUERY PLAN`` for it.
+A plan is flagged when it scans a table without an index or sorts it in
+a temporary B-tree, and the table holds more than ``threshold`` rows. An
+index-ordered ``SCAN ... USING INDEX`` is accepted: pagination stops it
+after one page. Cases run as a manager, whose querysets span the whole
+table; other roles only ever see their own rows.
+
+Used by the test suite and by ``manage.py explain_endpoints``, whose
+report is meant to be diffed between releases.
+"""
+import datetime
+import itertools
+import re
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from . import views
+from .models import Category, MenuItem, Order
+
+LIST_VIEWS = [views.MenuItemsListCreateView, views.OrdersListCreateView]
+DEFAULT_THRESHOLD = 500
+
+STEP = re.compile(r'^(SCAN|SEARCH) (?P<table>\S+)')
+SCAN = re.compile(r'^SCAN (?P<table>\S+)(?P<index> USING (COVERING )?INDEX)?')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY')
+
+
+@dataclass
+class PlanCase:
+    view: type
+    params: dict
+    sql: str
+    plan: list
+    problems: list = field(default_factory=list)
+
+    @property
+    def label(self):
+        name = self.view.__name__
+        if not self.params:
+            return f"{name} (defaults)"
+        query = '&'.join(
+            f"{key}={value}" for key, value in self.params.items()
+        )
+        return f"{name} ?{query}"
+
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        return sql, [row[-1] for row in cursor.fetchall()]
+
+
+def table_sizes():
+    return {
+        model._meta.db_table: model.objects.count()
+        for model in (Category, MenuItem, Order, User)
+    }
+
+
+def find_problems(plan, sizes, threshold):
+    """Return the plan lines that touch too many rows."""
+    problems = []
+    tables = []
+    for line in plan:
+        step = STEP.match(line)
+        if step:
+            tables.append(step.group('table'))
+        scan = SCAN.match(line)
+        if (
+            scan and not scan.group('index')
+            and sizes.get(scan.group('table'), 0) > threshold
+        ):
+            problems.append(f"full scan: {line}")
+        if TEMP_SORT.search(line) and any(
+            sizes.get(table, 0) > threshold for table in tables
+        ):
+            problems.append(f"temporary sort: {line}")
+    return problems
+
+
+def sample_value(model, name):
+    """A real value of ``name`` to filter on, so plans match live data."""
+    value = model.objects.order_by('pk').values_list(name, flat=True).first()
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, (datetime.date, Decimal)):
+        return str(value)
+    return value
+
+
+def view_params(view_class):
+    model = view_class.serializer_class.Meta.model
+    filters = [{}] + [
+        {name: sample_value(model, name)}
+        for name in view_class.filterset_fields
+    ]
+    orderings = [{}] + [
+        {'ordering': prefix + name}
+        for name in view_class.ordering_fields
+        for prefix in ('', '-')
+    ]
+    for filter_params, ordering_params in itertools.product(
+        filters, orderings
+    ):
+        yield {**filter_params, **ordering_params}
+
+
+def build_queryset(view_class, params, user):
+    request = APIRequestFactory().get('/', params)
+    force_authenticate(request, user=user)
+    view = view_class()
+    view.args, view.kwargs = (), {}
+    view.request = view.initialize_request(request)
+    view.format_kwarg = None
+    queryset = view.filter_queryset(view.get_queryset())
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE') or 10
+    return queryset[:page_size]
+
+
+def endpoint_cases(user, threshold=DEFAULT_THRESHOLD):
+    sizes = table_sizes()
+    for view_class in LIST_VIEWS:
+        for params in view_params(view_class):
+            queryset = build_queryset(view_class, params, user)
+            sql, plan = explain(queryset)
+            yield PlanCase(
+                view=view_class,
+                params=params,
+                sql=sql,
+                plan=plan,
+                problems=find_problems(plan, sizes, threshold),
+            )
+
+
+def format_report(cases):
+    lines = []
+    for case in cases:
+        flag = ' [!]' if case.problems else ''
+        lines.append(f"{case.label}{flag}")
+        lines.extend(f"    {line}" for line in case.plan)
+    return '\n'.join(lines)
+
+
+def seed(menu_items=2000, orders=2000, categories=20, customers=50):
+    """Bulk-create a dataset large enough for the planner to matter."""
+    category_objs = Category.objects.bulk_create(
+        Category(slug=f'plan-category-{i}', title=f'Category {i}')
+        for i in range(categories)
+    )
+    MenuItem.objects.bulk_create(
+        MenuItem(
+            title=f'Item {i:05d}',
+            price=Decimal(i % 300) / 10 + 1,
+            featured=i % 10 == 0,
+            category=category_objs[i % categories],
+        )
+        for i in range(menu_items)
+    )
+    users = User.objects.bulk_create(
+        User(username=f'plan-customer-{i}') for i in range(customers)
+    )
+    Order.objects.bulk_create(
+        Order(
+            user=users[i % customers],
+            status=i % 3 == 0,
+            total=Decimal(i % 500) / 5 + 5,
+        )
+        for i in range(orders)
+    )
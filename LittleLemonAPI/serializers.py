@@ -1,16 +1,131 @@
 from rest_framework import serializers
+from . import lookups
+from .priceindex import menu_prices
 from .models import Category, MenuItem, Cart, Order, OrderItem
 from django.contrib.auth.models import User
 
 
-class CategorySerializer(serializers.ModelSerializer):
+def parse_field_paths(value):
+    """Turn ``'id,menuitem.title'`` into ``{'id': {}, 'menuitem': {...}}``."""
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def query_tree(request, param):
+    if request is None:
+        return {}
+    return parse_field_paths(request.query_params.get(param, ''))
+
+
+class ExpandableFieldsMixin:
+    """
+    Add ``?fields=`` and ``?expand=`` support to a model serializer.
+
+    ``Meta.expandable_fields`` maps a field name to ``(serializer_class,
+    options)``. Unless the field is expanded, a to-one relation is rendered
+    by its collapsed declaration (a primary key) and a ``many`` relation,
+    which is not listed in ``Meta.fields``, is left out. Both parameters
+    take comma-separated dotted paths, e.g.
+    ``?expand=order_items.menuitem&fields=id,total,order_items.quantity``.
+    The root serializer reads them from the request; nested serializers
+    receive their subtree from the parent.
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if fields is None:
+            fields = query_tree(request, 'fields')
+        if expand is None:
+            expand = query_tree(request, 'expand')
+
+        expandable = getattr(self.Meta, 'expandable_fields', {})
+        for name, (serializer_class, options) in expandable.items():
+            if name in expand:
+                self.fields[name] = serializer_class(
+                    fields=fields.get(name, {}),
+                    expand=expand[name],
+                    read_only=True,
+                    **options
+                )
+
+        if fields:
+            for name in list(self.fields):
+                if name not in fields and not self.fields[name].write_only:
+                    self.fields.pop(name)
+
+    @classmethod
+    def project(cls, data, expand, fields):
+        """
+        Shape a fully expanded representation the way this serializer
+        would render it for ``expand`` and ``fields``.
+        """
+        data = dict(data)
+        expandable = getattr(cls.Meta, 'expandable_fields', {})
+        for name, (serializer_class, options) in expandable.items():
+            if name not in data:
+                continue
+            value = data[name]
+            if name in expand:
+                nested = (expand[name], fields.get(name, {}))
+                if options.get('many'):
+                    data[name] = [
+                        serializer_class.project(item, *nested)
+                        for item in value
+                    ]
+                elif value is not None:
+                    data[name] = serializer_class.project(value, *nested)
+            elif options.get('many'):
+                del data[name]
+            else:
+                data[name] = value['id'] if value is not None else None
+        if fields:
+            data = {name: data[name] for name in data if name in fields}
+        return data
+
+    @classmethod
+    def related_lookups(cls, expand, prefix='', prefetching=False):
+        """Return the ``select_related``/``prefetch_related`` paths."""
+        select, prefetch = [], []
+        expandable = getattr(cls.Meta, 'expandable_fields', {})
+        for name, subtree in expand.items():
+            if name not in expandable:
+                continue
+            serializer_class, options = expandable[name]
+            path = prefix + options.get('source', name)
+            many = prefetching or options.get('many', False)
+            (prefetch if many else select).append(path)
+            nested_select, nested_prefetch = serializer_class.related_lookups(
+                subtree, path + '__', many
+            )
+            select += nested_select
+            prefetch += nested_prefetch
+        return select, prefetch
+
+    @classmethod
+    def optimize_queryset(cls, queryset, request):
+        """Join or prefetch only the relations the request expands."""
+        select, prefetch = cls.related_lookups(query_tree(request, 'expand'))
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+
+class CategorySerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'slug', 'title']
 
 
-class MenuItemSerializer(serializers.ModelSerializer):
-    category = CategorySerializer(read_only=True)
+class MenuItemSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    category = serializers.PrimaryKeyRelatedField(read_only=True)
     category_id = serializers.IntegerField(write_only=True)
 
     class Meta:
@@ -19,10 +134,16 @@ class MenuItemSerializer(serializers.ModelSerializer):
             'id', 'title', 'price', 'featured',
             'category', 'category_id'
         ]
+        expandable_fields = {'category': (CategorySerializer, {})}
 
+    def validate_category_id(self, value):
+        if not lookups.category_exists(value):
+            raise serializers.ValidationError("Category does not exist.")
+        return value
 
-class CartSerializer(serializers.ModelSerializer):
-    menuitem = MenuItemSerializer(read_only=True)
+
+class CartSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    menuitem = serializers.PrimaryKeyRelatedField(read_only=True)
     menuitem_id = serializers.IntegerField(write_only=True)
 
     class Meta:
@@ -32,31 +153,59 @@ class CartSerializer(serializers.ModelSerializer):
             'quantity', 'unit_price', 'price'
         ]
         read_only_fields = ['user', 'unit_price', 'price']
+        expandable_fields = {'menuitem': (MenuItemSerializer, {})}
+
+    def validate_menuitem_id(self, value):
+        price = menu_prices.price(value)
+        if price is None:
+            raise serializers.ValidationError("Menu item does not exist.")
+        # Kept for create(), so saving does not look the price up again
+        self.menuitem_price = price
+        return value
 
+    def create(self, validated_data):
+        line = Cart(**validated_data)
+        line.save(unit_price=self.menuitem_price)
+        return line
 
-class OrderItemSerializer(serializers.ModelSerializer):
-    menuitem = MenuItemSerializer(read_only=True)
+
+class OrderItemSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    menuitem = serializers.PrimaryKeyRelatedField(read_only=True)
 
     class Meta:
         model = OrderItem
         fields = ['id', 'menuitem', 'quantity', 'unit_price', 'price']
         read_only_fields = ['unit_price', 'price']
+        expandable_fields = {'menuitem': (MenuItemSerializer, {})}
 
 
-class OrderSerializer(serializers.ModelSerializer):
-    order_items = OrderItemSerializer(many=True, read_only=True)
+class OrderSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     delivery_crew = serializers.PrimaryKeyRelatedField(
         queryset=User.objects.filter(groups__name='Delivery crew'),
         allow_null=True
     )
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if 'delivery_crew' in self.fields:
+            # Filter on the cached group id instead of joining auth_group
+            self.fields['delivery_crew'].queryset = lookups.group_members(
+                'Delivery crew'
+            )
+
     class Meta:
         model = Order
         fields = [
             'id', 'user', 'delivery_crew',
-            'status', 'total', 'date', 'order_items'
+            'status', 'total', 'date'
         ]
-        read_only_fields = ['user', 'total', 'date', 'order_items']
+        read_only_fields = ['user', 'total', 'date']
+        # Added to the representation only with ?expand=order_items
+        expandable_fields = {
+            'order_items': (
+                OrderItemSerializer, {'many': True, 'source': 'orderitem_set'}
+            ),
+        }
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -0,0 +1,26 @@
+from django.contrib.auth.models import Group
+from django.core.signals import request_finished, request_started
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import versions
+from .models import Category, MenuItem
+
+# Version tokens are read once per request
+request_started.connect(versions.begin_request)
+request_finished.connect(versions.end_request)
+
+
+@receiver([post_save, post_delete], sender=Group)
+def bump_group_version(sender, **kwargs):
+    versions.bump('groups')
+
+
+@receiver([post_save, post_delete], sender=Category)
+def bump_category_version(sender, **kwargs):
+    versions.bump('categories')
+
+
+@receiver([post_save, post_delete], sender=MenuItem)
+def bump_menu_version(sender, **kwargs):
+    versions.bump('menu')
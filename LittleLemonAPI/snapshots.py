@@ -0,0 +1,66 @@
+"""
+Pre-rendered orders.
+
+At checkout the order is rendered once, fully expanded, into
+``Order.snapshot``: its lines with the menu item titles, prices and
+categories as they were when the order was placed. Reads shape that
+document for the request's ``?expand=``/``?fields=`` instead of walking
+Order -> OrderItem -> MenuItem -> Category. ``Order.save()`` keeps the
+status and delivery crew in the snapshot current.
+
+Orders placed before snapshots existed are rendered by the serializer
+until ``manage.py backfill_snapshots`` has written theirs; reads never
+write.
+"""
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import prefetch_related_objects
+
+from .serializers import OrderSerializer, parse_field_paths, query_tree
+
+SNAPSHOT_EXPAND = parse_field_paths('order_items.menuitem.category')
+
+
+def write_snapshot(order):
+    prefetch_related_objects([order], 'orderitem_set__menuitem__category')
+    serializer = OrderSerializer(order, fields={}, expand=SNAPSHOT_EXPAND)
+    order.snapshot = json.loads(
+        json.dumps(serializer.data, cls=DjangoJSONEncoder)
+    )
+    order.save(update_fields=['snapshot'])
+    return order.snapshot
+
+
+def write_snapshots(orders):
+    """``write_snapshot()`` for many orders, prefetching their lines once."""
+    prefetch_related_objects(orders, 'orderitem_set__menuitem__category')
+    for order in orders:
+        write_snapshot(order)
+
+
+def render_orders(orders, request):
+    """Return the representations of ``orders`` for ``request``."""
+    expand = query_tree(request, 'expand')
+    fields = query_tree(request, 'fields')
+    missing = [order for order in orders if order.snapshot is None]
+    live = {}
+    if missing:
+        select, prefetch = OrderSerializer.related_lookups(expand)
+        prefetch_related_objects(missing, *select, *prefetch)
+        serializer = OrderSerializer(
+            missing, many=True, context={'request': request}
+        )
+        live = {
+            order.pk: data for order, data in zip(missing, serializer.data)
+        }
+    return [
+        live[order.pk] if order.snapshot is None
+        else OrderSerializer.project(order.snapshot, expand, fields)
+        for order in orders
+    ]
+
+
+def render_order(order, request):
+    """Return the representation of ``order`` for ``request``."""
+    return render_orders([order], request)[0]
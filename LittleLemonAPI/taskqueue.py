@@ -0,0 +1,260 @@
+"""
+Database-backed background task queue.
+
+Handlers are registered with ``@task`` and enqueued with ``enqueue()``.
+The task row is written inside the caller's transaction, so a request that
+rolls back never leaves side effects behind. ``TaskWorker`` claims due
+tasks, runs them on a thread pool and deletes them once they succeed.
+
+A worker that dies mid-task leaves its rows ``running`` until their lease
+expires, after which they are claimed again. Rows are deleted in the
+handler's transaction, so database writes of a handler apply once; any
+other side effects (messages, calls out) may repeat and must be
+idempotent.
+"""
+import logging
+import threading
+import traceback
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+def queue_setting(name):
+    return settings.TASK_QUEUE.get(name)
+
+
+class Handler:
+    def __init__(self, func, batch):
+        self.func = func
+        self.batch = batch
+
+    def __call__(self, payloads):
+        if self.batch:
+            self.func(payloads)
+        else:
+            for payload in payloads:
+                self.func(**payload)
+
+
+def task(name=None, batch=False):
+    """
+    Register a task handler.
+
+    Batch handlers are called once with the list of payloads of every
+    claimed task of that name; plain handlers are called once per task
+    with the payload as keyword arguments.
+    """
+    def decorator(func):
+        _registry[name or func.__name__] = Handler(func, batch)
+        return func
+    return decorator
+
+
+def enqueue(name, delay=0, **payload):
+    if name not in _registry:
+        raise KeyError(f"Unknown task: {name}")
+    return Task.objects.create(
+        name=name,
+        payload=payload,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def claim(limit=None, worker_id=None):
+    """
+    Atomically claim up to ``limit`` due tasks for ``worker_id``.
+
+    Candidates are pending tasks whose ``run_at`` has passed and running
+    tasks whose lease expired. The claiming UPDATE re-checks that
+    condition, so concurrent workers never claim the same row twice.
+    """
+    limit = limit or queue_setting('BATCH_SIZE')
+    worker_id = worker_id or uuid.uuid4().hex
+    now = timezone.now()
+    due = (
+        Q(status=Task.PENDING, run_at__lte=now)
+        | Q(status=Task.RUNNING, locked_until__lt=now)
+    )
+    candidates = list(
+        Task.objects.filter(due)
+        .order_by('run_at')
+        .values_list('pk', flat=True)[:limit]
+    )
+    if not candidates:
+        return []
+    Task.objects.filter(due, pk__in=candidates).update(
+        status=Task.RUNNING,
+        claimed_by=worker_id,
+        locked_until=now + timedelta(seconds=queue_setting('LEASE')),
+        attempts=F('attempts') + 1,
+    )
+    return list(
+        Task.objects.filter(
+            pk__in=candidates, status=Task.RUNNING, claimed_by=worker_id
+        )
+    )
+
+
+def group_tasks(tasks):
+    """Split claimed tasks into units of work, merging batch handlers."""
+    groups = defaultdict(list)
+    units = []
+    for item in tasks:
+        handler = _registry.get(item.name)
+        if handler is not None and handler.batch:
+            groups[item.name].append(item)
+        else:
+            units.append([item])
+    return units + list(groups.values())
+
+
+def held(item):
+    """``item``'s row, as long as its lease is still held by its claimer."""
+    return Task.objects.filter(
+        pk=item.pk, status=Task.RUNNING, claimed_by=item.claimed_by
+    )
+
+
+def execute(tasks):
+    """
+    Run one unit of work and record its outcome on the tasks it ran.
+
+    Each task row is deleted through its lease in the handler's
+    transaction, so the handler's writes and the acknowledgement commit or
+    roll back together. Only the tasks whose delete matched are run, and
+    on failure only those are retried; a task whose lease passed to
+    another worker meanwhile is left to that worker.
+    """
+    name = tasks[0].name
+    handler = _registry.get(name)
+    owned = tasks
+    try:
+        if handler is None:
+            raise KeyError(f"Unknown task: {name}")
+        with transaction.atomic():
+            owned = [item for item in tasks if held(item).delete()[0]]
+            if owned:
+                handler([item.payload for item in owned])
+    except Exception:
+        error = traceback.format_exc()
+        logger.warning("Task %s failed:\n%s", name, error)
+        for item in owned:
+            retry(item, error)
+        return False
+    return True
+
+
+def retry(item, error):
+    if item.attempts >= queue_setting('MAX_ATTEMPTS'):
+        item.status = Task.FAILED
+    else:
+        backoff = queue_setting('RETRY_BACKOFF') * 2 ** (item.attempts - 1)
+        item.status = Task.PENDING
+        item.run_at = timezone.now() + timedelta(seconds=backoff)
+    item.locked_until = None
+    item.last_error = error
+    # Through the lease, so a task taken over since is not released
+    held(item).update(
+        status=item.status,
+        run_at=item.run_at,
+        locked_until=None,
+        last_error=error,
+    )
+
+
+def run_pending(limit=None):
+    """Claim and run due tasks in the calling thread; return the count."""
+    tasks = claim(limit)
+    for unit in group_tasks(tasks):
+        execute(unit)
+    return len(tasks)
+
+
+class TaskWorker:
+    """
+    Poll the queue and run claimed work on a pool of threads.
+
+    One dispatcher thread claims tasks and hands each unit of work to the
+    pool; it only claims again once the previous claim has drained, so a
+    worker never holds more leases than it can run.
+    """
+
+    def __init__(self, workers=None, poll_interval=None):
+        self.workers = workers or queue_setting('WORKERS')
+        self.poll_interval = poll_interval or queue_setting('POLL_INTERVAL')
+        self.worker_id = uuid.uuid4().hex
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self.run, name='littlelemon-tasks', daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self):
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix='littlelemon-task'
+        ) as pool:
+            while not self._stop.is_set():
+                try:
+                    tasks = claim(worker_id=self.worker_id)
+                except Exception:
+                    logger.exception("Could not claim tasks")
+                    tasks = []
+                finally:
+                    close_old_connections()
+                if not tasks:
+                    self._stop.wait(self.poll_interval)
+                    continue
+                futures = [
+                    pool.submit(self._execute, unit)
+                    for unit in group_tasks(tasks)
+                ]
+                for future in futures:
+                    future.result()
+
+    def _execute(self, unit):
+        try:
+            execute(unit)
+        except Exception:
+            # Recording the outcome failed (e.g. a locked database); the
+            # rows keep their lease and are claimed again once it expires
+            logger.exception("Could not record outcome of %s", unit[0].name)
+        finally:
+            close_old_connections()
+
+
+_worker = None
+
+
+def autostart_workers():
+    """
+    Start an in-process worker when ``TASK_QUEUE['AUTOSTART']`` is set.
+
+    Called from the WSGI/ASGI entry points; with a pre-forking server that
+    preloads the app, call it from the post-fork hook instead.
+    """
+    global _worker
+    if queue_setting('AUTOSTART') and _worker is None:
+        _worker = TaskWorker().start()
+    return _worker
@@ -0,0 +1,38 @@
+"""
+Background work that follows checkout.
+
+Registered with the database task queue in ``taskqueue``; this module is
+imported from ``AppConfig.ready()`` so every process knows the handlers.
+"""
+import logging
+
+from django.contrib.auth.models import User
+
+from . import popularity
+from .models import Order
+from .taskqueue import task
+
+logger = logging.getLogger(__name__)
+
+
+@task(batch=True)
+def notify_delivery_crew(payloads):
+    """Tell the delivery crew about new unassigned orders in one message."""
+    order_ids = sorted({payload['order_id'] for payload in payloads})
+    orders = Order.objects.filter(
+        pk__in=order_ids, delivery_crew__isnull=True
+    ).values_list('pk', flat=True)
+    if not orders:
+        return
+    crew = User.objects.filter(groups__name='Delivery crew')
+    logger.info(
+        "Notifying %d delivery crew member(s) about order(s) %s",
+        crew.count(),
+        ', '.join(str(pk) for pk in orders),
+    )
+
+
+@task(batch=True)
+def record_item_orders(payloads):
+    """Add checked-out quantities to the popular items counters."""
+    popularity.record_orders(payloads)
@@ -2,8 +2,35 @@ from django.test import TestCase
 from django.contrib.auth.models import User, Group
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Category, MenuItem, Cart, Order, OrderItem
+from .models import (
+    Category, MenuItem, Cart, Order, OrderItem, MenuItemDailyCount, Task
+)
+from . import (
+    cachebench, loadshedding, lookups, popularity, queryplans, versions
+)
+from .cache import SQLiteCache
+from .management.commands import purge_carts
+from .priceindex import menu_prices
+from .taskqueue import (
+    TaskWorker, claim, enqueue, execute, group_tasks, run_pending, task
+)
+from .views import open_orders
+from .warmup import warm_up
+import datetime
+import io
+import multiprocessing
+import threading
+import time
+from decimal import Decimal
+import tempfile
+from django.conf import settings
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from unittest import mock
 
 
 class LittleLemonAPITests(TestCase):
@@ -174,3 +201,997 @@ class LittleLemonAPITests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]['status'], 'pending')
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='etaguser',
+            password='testpass'
+        )
+        cls.category = Category.objects.create(
+            slug='mains',
+            title='Mains'
+        )
+        cls.menu_item = MenuItem.objects.create(
+            title='Lemon Chicken',
+            price=12.50,
+            category=cls.category
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_menu_items_not_modified(self):
+        url = reverse('LittleLemonAPI:menu-items-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response.headers['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.menu_item.price = 13.00
+        self.menu_item.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_menu_item_detail_last_modified(self):
+        url = reverse(
+            'LittleLemonAPI:menu-item-detail',
+            args=[self.menu_item.id]
+        )
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(
+            url,
+            HTTP_IF_MODIFIED_SINCE=response.headers['Last-Modified']
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_cart_changes_on_delete(self):
+        Cart.objects.create(user=self.user, menuitem=self.menu_item)
+        url = reverse('LittleLemonAPI:cart')
+        etag = self.client.get(url).headers['ETag']
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+            status.HTTP_304_NOT_MODIFIED
+        )
+
+        Cart.objects.filter(user=self.user).delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+batched_calls = []
+
+
+@task(name='test_batched', batch=True)
+def record_batch(payloads):
+    batched_calls.append(payloads)
+
+
+@task(name='test_failing')
+def always_fail(**payload):
+    raise RuntimeError("boom")
+
+
+@task(name='test_failing_batch', batch=True)
+def always_fail_batch(payloads):
+    raise RuntimeError("boom")
+
+
+class TaskQueueTests(TestCase):
+    def setUp(self):
+        batched_calls.clear()
+
+    def test_batch_handler_runs_once(self):
+        enqueue('test_batched', value=1)
+        enqueue('test_batched', value=2)
+        self.assertEqual(run_pending(), 2)
+        self.assertEqual(batched_calls, [[{'value': 1}, {'value': 2}]])
+        self.assertFalse(Task.objects.exists())
+
+    def test_failed_task_is_retried_with_backoff(self):
+        item = enqueue('test_failing')
+        run_pending()
+        item.refresh_from_db()
+        self.assertEqual(item.status, Task.PENDING)
+        self.assertEqual(item.attempts, 1)
+        self.assertGreater(item.run_at, timezone.now())
+        self.assertIn('boom', item.last_error)
+        # Not due yet
+        self.assertEqual(run_pending(), 0)
+
+    def test_task_fails_after_max_attempts(self):
+        item = enqueue('test_failing')
+        Task.objects.filter(pk=item.pk).update(attempts=4)
+        run_pending()
+        item.refresh_from_db()
+        self.assertEqual(item.status, Task.FAILED)
+
+    def test_expired_lease_is_reclaimed(self):
+        item = enqueue('test_batched', value=3)
+        Task.objects.filter(pk=item.pk).update(
+            status=Task.RUNNING,
+            locked_until=timezone.now() - timezone.timedelta(seconds=1)
+        )
+        self.assertEqual(run_pending(), 1)
+        self.assertEqual(batched_calls, [[{'value': 3}]])
+
+    def test_failed_batch_leaves_taken_over_tasks_alone(self):
+        kept = enqueue('test_failing_batch', value=1)
+        taken = enqueue('test_failing_batch', value=2)
+        first = claim(worker_id='first')
+        # The first worker stalls past one lease; a second one takes over
+        Task.objects.filter(pk=taken.pk).update(
+            locked_until=timezone.now() - timezone.timedelta(seconds=1)
+        )
+        self.assertEqual(
+            [item.pk for item in claim(worker_id='second')], [taken.pk]
+        )
+        self.assertFalse(execute(first))
+
+        kept.refresh_from_db()
+        self.assertEqual(kept.status, Task.PENDING)
+        self.assertIsNone(kept.locked_until)
+        taken.refresh_from_db()
+        self.assertEqual(taken.status, Task.RUNNING)
+        self.assertEqual(taken.claimed_by, 'second')
+        self.assertGreater(taken.locked_until, timezone.now())
+        self.assertEqual(taken.last_error, '')
+
+    def test_worker_survives_bookkeeping_errors(self):
+        item = enqueue('test_failing')
+        worker = TaskWorker(workers=1)
+        with mock.patch(
+            'LittleLemonAPI.taskqueue.retry',
+            side_effect=OperationalError('database is locked')
+        ), self.assertLogs('LittleLemonAPI.taskqueue', 'ERROR'):
+            worker._execute(claim(worker_id=worker.worker_id))
+        item.refresh_from_db()
+        self.assertEqual(item.status, Task.RUNNING)
+
+
+class SparseFieldsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='fieldsuser',
+            password='testpass'
+        )
+        cls.category = Category.objects.create(
+            slug='desserts',
+            title='Desserts'
+        )
+        cls.menu_item = MenuItem.objects.create(
+            title='Lemon Tart',
+            price=6.50,
+            category=cls.category
+        )
+        cls.order = Order.objects.create(user=cls.user, total=13.00)
+        OrderItem.objects.create(
+            order=cls.order,
+            menuitem=cls.menu_item,
+            quantity=2,
+            unit_price=6.50,
+            price=13.00
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def test_relations_are_collapsed_by_default(self):
+        response = self.client.get(
+            reverse('LittleLemonAPI:menu-items-list')
+        )
+        self.assertEqual(
+            response.data['results'][0]['category'],
+            self.category.id
+        )
+
+    def test_sparse_order_list(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('LittleLemonAPI:orders-list'),
+                {'fields': 'id,status,total'}
+            )
+        self.assertFalse(
+            any('orderitem' in query['sql'] for query in queries)
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(response.data['results'][0]),
+            {'id', 'status', 'total'}
+        )
+
+    def test_nested_expansion(self):
+        url = reverse('LittleLemonAPI:order-detail', args=[self.order.id])
+        response = self.client.get(url, {
+            'expand': 'order_items.menuitem.category',
+            'fields': 'id,order_items.quantity,order_items.menuitem',
+        })
+        self.assertEqual(set(response.data), {'id', 'order_items'})
+        item = response.data['order_items'][0]
+        self.assertEqual(item['quantity'], 2)
+        self.assertEqual(item['menuitem']['category']['title'], 'Desserts')
+
+
+class ProfilingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user(
+            username='profilemanager',
+            password='testpass',
+            is_staff=True
+        )
+        manager_group = Group.objects.create(name='Manager')
+        manager_group.user_set.add(cls.manager)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        profiling = override_settings(PROFILING={
+            **settings.PROFILING,
+            'DIRECTORY': directory.name,
+            'MAX_PROFILES': 2,
+        })
+        profiling.enable()
+        self.addCleanup(profiling.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.manager)
+
+    def test_token_profiles_request(self):
+        url = reverse('LittleLemonAPI:menu-items-list')
+        token = self.client.post(
+            reverse('LittleLemonAPI:profile-token')
+        ).data['token']
+        for _ in range(3):
+            self.client.get(url, HTTP_X_PROFILE_TOKEN=token)
+
+        response = self.client.get(reverse('LittleLemonAPI:profiles'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Oldest profile dropped from the ring
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(response.data[0]['path'], url)
+        self.assertGreater(response.data[0]['query_count'], 0)
+
+    def test_invalid_token_is_ignored(self):
+        self.client.get(
+            reverse('LittleLemonAPI:menu-items-list'),
+            {'profile': 'forged'}
+        )
+        response = self.client.get(reverse('LittleLemonAPI:profiles'))
+        self.assertEqual(response.data, [])
+
+
+class WarmUpTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.delivery_crew_group = Group.objects.create(name='Delivery crew')
+        cls.category = Category.objects.create(slug='sides', title='Sides')
+
+    def setUp(self):
+        # Cached ids would outlive the rolled back test data
+        self.addCleanup(lookups.clear)
+
+    def test_warm_up_preloads_lookups(self):
+        report = warm_up()
+        self.assertIn('total', report)
+        # Only the version check, once for the whole request
+        with versions.request_scope(), self.assertNumQueries(1):
+            self.assertEqual(
+                lookups.group_id('Delivery crew'),
+                self.delivery_crew_group.id
+            )
+            self.assertTrue(lookups.category_exists(self.category.id))
+
+    def test_lookups_follow_changes(self):
+        warm_up()
+        category = Category.objects.create(slug='drinks', title='Drinks')
+        self.assertTrue(lookups.category_exists(category.id))
+        self.delivery_crew_group.delete()
+        self.assertIsNone(lookups.group_id('Delivery crew'))
+
+    def test_rows_deleted_elsewhere_are_not_trusted(self):
+        warm_up()
+        # What a write from another process leaves behind: the rows and
+        # the version token change, this process' tables do not
+        Category.objects.filter(pk=self.category.pk)._raw_delete('default')
+        versions.bump('categories')
+        self.assertFalse(lookups.category_exists(self.category.id))
+
+
+class PopularItemsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='hungry',
+            password='testpass'
+        )
+        cls.mains = Category.objects.create(slug='main', title='Main')
+        cls.drinks = Category.objects.create(slug='drink', title='Drink')
+        cls.pasta = MenuItem.objects.create(
+            title='Pasta',
+            price=9.00,
+            category=cls.mains
+        )
+        cls.soup = MenuItem.objects.create(
+            title='Soup',
+            price=5.00,
+            category=cls.mains
+        )
+        cls.lemonade = MenuItem.objects.create(
+            title='Lemonade',
+            price=3.00,
+            category=cls.drinks
+        )
+
+    def setUp(self):
+        popularity.index.rebuild()
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+    def checkout(self, **quantities):
+        for item, quantity in quantities.items():
+            Cart.objects.create(
+                user=self.user,
+                menuitem=getattr(self, item),
+                quantity=quantity
+            )
+        self.client.post(reverse('LittleLemonAPI:orders-list'))
+
+    def test_checkout_updates_ranking(self):
+        self.checkout(pasta=1, soup=2, lemonade=5)
+        self.checkout(pasta=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            run_pending()
+
+        url = reverse('LittleLemonAPI:popular-items')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'window': 7})
+        self.assertFalse(
+            any('orderitem' in query['sql'] for query in queries)
+        )
+        ranking = [
+            (row['menuitem']['title'], row['orders'])
+            for row in response.data['results']
+        ]
+        self.assertEqual(
+            ranking,
+            [('Lemonade', 5), ('Pasta', 3), ('Soup', 2)]
+        )
+
+        response = self.client.get(url, {'category': self.mains.id})
+        self.assertEqual(
+            [row['orders'] for row in response.data['results']],
+            [3, 2]
+        )
+
+    def test_index_rebuilds_from_counters(self):
+        self.checkout(soup=4)
+        run_pending()
+        popularity.index.rebuild()
+        self.assertEqual(
+            popularity.index.top(window=1),
+            [(self.soup.id, 4)]
+        )
+
+    def test_reclaimed_task_is_counted_once(self):
+        self.checkout(soup=4)
+        first = claim(worker_id='first')
+        # The first worker stalls past its lease; a second one takes over
+        Task.objects.update(
+            locked_until=timezone.now() - timezone.timedelta(seconds=1)
+        )
+        second = claim(worker_id='second')
+        for tasks in (second, first):
+            for unit in group_tasks(tasks):
+                self.assertTrue(execute(unit))
+        self.assertEqual(
+            MenuItemDailyCount.objects.get(menuitem=self.soup).count, 4
+        )
+        self.assertFalse(Task.objects.exists())
+
+    def test_rebuild_before_commit_callback_counts_once(self):
+        self.checkout(pasta=3)
+        with self.captureOnCommitCallbacks() as callbacks:
+            run_pending()
+        popularity.index.rebuild()
+        for callback in callbacks:
+            callback()
+        self.assertEqual(
+            popularity.index.top(window=1),
+            [(self.pasta.id, 3)]
+        )
+
+    def test_invalid_window(self):
+        response = self.client.get(
+            reverse('LittleLemonAPI:popular-items'),
+            {'window': 365}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PurgeCartsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(slug='bread', title='Bread')
+        cls.bread = MenuItem.objects.create(
+            title='Focaccia',
+            price=4.00,
+            category=category
+        )
+        cls.olives = MenuItem.objects.create(
+            title='Olives',
+            price=3.50,
+            category=category
+        )
+        cls.idle = User.objects.create_user(username='idle')
+        cls.active = User.objects.create_user(username='active')
+
+    def setUp(self):
+        long_ago = timezone.now() - datetime.timedelta(days=10)
+        for user in (self.idle, self.active):
+            Cart.objects.create(user=user, menuitem=self.bread)
+        Cart.objects.update(updated_at=long_ago)
+        # A recent line keeps the whole cart alive
+        Cart.objects.create(user=self.active, menuitem=self.olives)
+        MenuItemDailyCount.objects.create(
+            menuitem=self.bread,
+            day=datetime.date.today() - datetime.timedelta(days=400),
+            count=3
+        )
+
+    def purge(self, *args):
+        out = io.StringIO()
+        call_command('purge_carts', '--batch-size=1', *args, stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_deletes_nothing(self):
+        output = self.purge('--dry-run')
+        self.assertIn('Would purge 1 cart line(s) from 1 idle cart(s)', output)
+        self.assertEqual(Cart.objects.count(), 3)
+        self.assertEqual(MenuItemDailyCount.objects.count(), 1)
+
+    def test_purges_idle_carts_only(self):
+        output = self.purge()
+        self.assertIn('Purged 1 cart line(s) from 1 idle cart(s)', output)
+        self.assertIn('1 expired popularity counter(s)', output)
+        self.assertFalse(Cart.objects.filter(user=self.idle).exists())
+        self.assertEqual(Cart.objects.filter(user=self.active).count(), 2)
+        self.assertFalse(MenuItemDailyCount.objects.exists())
+
+    def test_spared_carts_are_not_reported(self):
+        # The active cart was picked, then touched before the delete
+        with mock.patch.object(
+            purge_carts.Command,
+            'idle_users',
+            side_effect=[[self.idle.pk, self.active.pk], []]
+        ), CaptureQueriesContext(connection) as queries:
+            output = self.purge('--batch-size=10')
+        self.assertIn('Purged 1 cart line(s) from 1 idle cart(s)', output)
+        self.assertEqual(Cart.objects.filter(user=self.active).count(), 2)
+        # Sparing active carts is part of the DELETE itself, so a line
+        # added meanwhile cannot slip between a check and the delete
+        deletes = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('DELETE FROM "LittleLemonAPI_cart"')
+        ]
+        self.assertEqual(len(deletes), 1)
+        self.assertIn('NOT ("LittleLemonAPI_cart"."user_id" IN (SELECT',
+                      deletes[0])
+
+
+class DeliveryQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='diner')
+        cls.courier = User.objects.create_user(username='courier')
+        cls.other_courier = User.objects.create_user(username='courier2')
+        crew = Group.objects.create(name='Delivery crew')
+        crew.user_set.add(cls.courier, cls.other_courier)
+
+    def setUp(self):
+        self.newer = Order.objects.create(user=self.customer, total=10)
+        self.older = Order.objects.create(user=self.customer, total=20)
+        Order.objects.filter(pk=self.older.pk).update(
+            date=datetime.date.today() - datetime.timedelta(days=1)
+        )
+        self.assigned = Order.objects.create(
+            user=self.customer,
+            delivery_crew=self.other_courier,
+            total=30
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.courier)
+
+    def test_queue_lists_unassigned_orders(self):
+        response = self.client.get(reverse('LittleLemonAPI:delivery-queue'))
+        self.assertEqual(
+            [order['id'] for order in response.data['results']],
+            [self.older.id, self.newer.id]
+        )
+
+    def test_claim_oldest_order(self):
+        url = reverse('LittleLemonAPI:delivery-claim')
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], self.older.id)
+        self.assertEqual(response.data['delivery_crew'], self.courier.id)
+
+        self.assertEqual(self.client.post(url).data['id'], self.newer.id)
+        self.assertEqual(
+            self.client.post(url).status_code,
+            status.HTTP_404_NOT_FOUND
+        )
+        self.assigned.refresh_from_db()
+        self.assertEqual(self.assigned.delivery_crew, self.other_courier)
+
+    def test_queue_uses_composite_index(self):
+        sql, params = open_orders().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('order_crew_status_date_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_customers_cannot_claim(self):
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.post(reverse('LittleLemonAPI:delivery-claim'))
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class QueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        queryplans.seed()
+        cls.manager = User.objects.create_user(username='planner')
+        Group.objects.create(name='Manager').user_set.add(cls.manager)
+
+    def test_list_endpoints_use_indexes(self):
+        cases = list(queryplans.endpoint_cases(self.manager))
+        self.assertGreater(len(cases), 20)
+        flagged = [case for case in cases if case.problems]
+        self.assertEqual(flagged, [], queryplans.format_report(flagged))
+
+    def test_scans_and_sorts_are_flagged(self):
+        sizes = {'LittleLemonAPI_order': 1000}
+        problems = queryplans.find_problems(
+            ['SCAN LittleLemonAPI_order', 'USE TEMP B-TREE FOR ORDER BY'],
+            sizes,
+            threshold=500
+        )
+        self.assertEqual(len(problems), 2)
+        self.assertEqual(
+            queryplans.find_problems(
+                ['SCAN LittleLemonAPI_order'], sizes, threshold=5000
+            ),
+            []
+        )
+
+
+class OrderSnapshotTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='regular')
+        cls.courier = User.objects.create_user(username='rider')
+        Group.objects.create(name='Delivery crew').user_set.add(cls.courier)
+        category = Category.objects.create(slug='salads', title='Salads')
+        cls.salad = MenuItem.objects.create(
+            title='Greek Salad',
+            price=8.00,
+            category=category
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+        Cart.objects.create(
+            user=self.customer,
+            menuitem=self.salad,
+            quantity=2
+        )
+        response = self.client.post(reverse('LittleLemonAPI:orders-list'))
+        self.order = Order.objects.get(pk=response.data['id'])
+        self.url = reverse('LittleLemonAPI:order-detail', args=[self.order.id])
+
+    def test_snapshot_keeps_checkout_prices(self):
+        self.salad.title = 'Salad'
+        self.salad.price = 9.50
+        self.salad.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                self.url,
+                {'expand': 'order_items.menuitem'}
+            )
+        self.assertFalse(
+            any('orderitem' in query['sql'] for query in queries)
+        )
+        menuitem = response.data['order_items'][0]['menuitem']
+        self.assertEqual(menuitem['title'], 'Greek Salad')
+        self.assertEqual(menuitem['price'], '8.00')
+        # Unexpanded relations collapse to ids
+        self.assertEqual(menuitem['category'], self.salad.category_id)
+
+    def test_status_change_updates_snapshot(self):
+        self.client.force_authenticate(user=self.courier)
+        response = self.client.patch(
+            self.url,
+            {'status': True},
+            format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.order.refresh_from_db()
+        self.assertTrue(self.order.snapshot['status'])
+
+        self.client.force_authenticate(user=self.customer)
+        response = self.client.get(reverse('LittleLemonAPI:orders-list'))
+        self.assertTrue(response.data['results'][0]['status'])
+
+    def test_claim_updates_snapshot(self):
+        self.client.force_authenticate(user=self.courier)
+        self.client.post(reverse('LittleLemonAPI:delivery-claim'))
+        self.order.refresh_from_db()
+        self.assertEqual(
+            self.order.snapshot['delivery_crew'],
+            self.courier.id
+        )
+
+    def test_failed_snapshot_write_undoes_the_claim(self):
+        self.client.force_authenticate(user=self.courier)
+        with mock.patch.object(
+            Order, 'save', side_effect=OperationalError('disk I/O error')
+        ), self.assertRaises(OperationalError):
+            self.client.post(reverse('LittleLemonAPI:delivery-claim'))
+        self.order.refresh_from_db()
+        self.assertIsNone(self.order.delivery_crew)
+        self.assertIsNone(self.order.snapshot['delivery_crew'])
+
+    def place_legacy_orders(self, count):
+        """Orders from before snapshots existed."""
+        for _ in range(count):
+            order = Order.objects.create(user=self.customer, total=8.00)
+            OrderItem.objects.create(
+                order=order,
+                menuitem=self.salad,
+                quantity=1,
+                unit_price=8.00,
+                price=8.00
+            )
+
+    def list_orders(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('LittleLemonAPI:orders-list'),
+                {'expand': 'order_items.menuitem'}
+            )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, [query['sql'] for query in queries]
+
+    def test_orders_without_snapshot_are_not_written_on_read(self):
+        self.place_legacy_orders(2)
+        _, few = self.list_orders()
+        self.place_legacy_orders(3)
+        response, more = self.list_orders()
+
+        self.assertEqual(len(few), len(more))
+        self.assertFalse(any(sql.startswith('UPDATE') for sql in more))
+        self.assertEqual(
+            Order.objects.filter(snapshot__isnull=True).count(), 5
+        )
+        menuitems = [
+            order['order_items'][0]['menuitem']['title']
+            for order in response.data['results']
+        ]
+        self.assertEqual(menuitems, ['Greek Salad'] * 6)
+
+    def test_backfill_snapshots(self):
+        self.place_legacy_orders(3)
+        out = io.StringIO()
+        call_command('backfill_snapshots', '--batch-size=2', stdout=out)
+        self.assertIn('Wrote 3 order snapshot(s).', out.getvalue())
+        self.assertFalse(Order.objects.filter(snapshot__isnull=True).exists())
+        order = Order.objects.order_by('pk').last()
+        self.assertEqual(
+            order.snapshot['order_items'][0]['menuitem']['title'],
+            'Greek Salad'
+        )
+
+
+class LoadSheddingTests(TestCase):
+    """Run against the shipped ``LOAD_SHEDDING`` settings."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user(
+            username='ops',
+            is_staff=True
+        )
+
+    def setUp(self):
+        self.shedder = loadshedding.LoadShedder.from_settings()
+        self.critical = self.shedder.classes['critical']
+        self.normal = self.shedder.classes['normal']
+        self.low = self.shedder.classes['low']
+
+    def fill(self, priority, count):
+        for _ in range(count):
+            self.assertTrue(self.shedder.acquire(priority))
+
+    def acquire_in_thread(self, priority):
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(self.shedder.acquire(priority))
+        )
+        thread.start()
+        self.addCleanup(thread.join)
+        return thread, results
+
+    def wait_for_queue(self, priority, length=1):
+        deadline = time.monotonic() + 1
+        while len(priority.queue) < length:
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.001)
+
+    def test_reserve_keeps_room_for_critical(self):
+        self.fill(self.normal, self.shedder.capacity - self.shedder.reserve)
+        self.assertFalse(self.shedder.acquire(self.low))
+        self.assertTrue(self.shedder.acquire(self.critical))
+        # Admitted into the reserve while every other slot is taken
+        self.assertEqual(self.shedder.active, self.shedder.capacity)
+        self.assertEqual(self.critical.admitted, 1)
+
+    def test_low_priority_shed_once_queue_wait_passes_target(self):
+        self.fill(self.critical, self.shedder.capacity)
+        thread, results = self.acquire_in_thread(self.normal)
+        self.wait_for_queue(self.normal)
+        time.sleep(self.shedder.target_wait * 2)
+
+        start = time.monotonic()
+        self.assertFalse(self.shedder.acquire(self.low))
+        # Shed without queueing for its full allowance
+        self.assertLess(time.monotonic() - start, self.low.max_wait / 2)
+
+        self.shedder.release()
+        self.shedder.release()
+        thread.join()
+        self.assertEqual(results, [True])
+
+    def test_free_slot_goes_to_higher_class(self):
+        self.fill(self.critical, self.shedder.capacity)
+        low_thread, low_results = self.acquire_in_thread(self.low)
+        self.wait_for_queue(self.low)
+        normal_thread, normal_results = self.acquire_in_thread(self.normal)
+        self.wait_for_queue(self.normal)
+
+        # Room for exactly one request outside the reserve
+        self.shedder.release()
+        self.shedder.release()
+        normal_thread.join()
+        low_thread.join()
+        self.assertEqual(normal_results, [True])
+        self.assertEqual(low_results, [False])
+
+    def test_middleware_sheds_low_priority_first(self):
+        client = APIClient()
+        client.force_authenticate(user=self.admin)
+        client.get(reverse('LittleLemonAPI:load-shedding'))
+        shedder = loadshedding.shedder
+        normal = shedder.classes['normal']
+        for _ in range(shedder.capacity - shedder.reserve):
+            self.assertTrue(shedder.acquire(normal))
+
+        response = client.get(reverse('LittleLemonAPI:menu-items-list'))
+        self.assertEqual(
+            response.status_code,
+            status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        self.assertEqual(response.headers['Retry-After'], '1')
+        response = client.post(reverse('LittleLemonAPI:orders-list'))
+        self.assertNotEqual(
+            response.status_code,
+            status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+
+        for _ in range(shedder.capacity - shedder.reserve):
+            shedder.release()
+        response = client.get(reverse('LittleLemonAPI:load-shedding'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['classes']['low']['shed'], 1)
+        self.assertEqual(response.data['classes']['critical']['admitted'], 1)
+
+    async def test_async_requests_are_admitted(self):
+        response = await self.async_client.get(
+            reverse('LittleLemonAPI:home')
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        stats = loadshedding.shedder.stats()
+        self.assertEqual(stats['classes']['low']['admitted'], 1)
+        self.assertEqual(stats['active'], 0)
+
+
+class MenuPriceIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user(username='caterer')
+        category = Category.objects.create(slug='platters', title='Platters')
+        cls.items = MenuItem.objects.bulk_create(
+            MenuItem(
+                title=f'Platter {i}',
+                price=Decimal(f'{10 + i}.50'),
+                category=category
+            )
+            for i in range(20)
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.customer)
+
+    def test_prices_skip_unknown_ids(self):
+        first, second = self.items[:2]
+        self.assertEqual(
+            menu_prices.prices([second.id, 0, first.id]),
+            {first.id: Decimal('10.50'), second.id: Decimal('11.50')}
+        )
+        self.assertFalse(menu_prices.exists(0))
+
+    def test_price_changes_reach_the_cart(self):
+        item = self.items[0]
+        menu_prices.load()
+        item.price = Decimal('12.25')
+        item.save()
+        line = Cart.objects.create(
+            user=self.customer,
+            menuitem_id=item.id,
+            quantity=2
+        )
+        self.assertEqual(line.unit_price, Decimal('12.25'))
+        self.assertEqual(line.price, Decimal('24.50'))
+
+    def test_queryset_updates_reach_the_index(self):
+        item = self.items[0]
+        menu_prices.load()
+        MenuItem.objects.filter(pk=item.pk).update(price=Decimal('9.75'))
+        self.assertEqual(menu_prices.price(item.pk), Decimal('9.75'))
+        MenuItem.objects.filter(pk=item.pk).delete()
+        self.assertFalse(menu_prices.exists(item.pk))
+
+    def test_adding_to_cart_reads_the_version_once(self):
+        item = self.items[0]
+        menu_prices.load()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse('LittleLemonAPI:cart'),
+                {'menuitem_id': item.id, 'quantity': 2}
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['unit_price'], '10.50')
+        sql = [query['sql'] for query in queries]
+        self.assertFalse(
+            [query for query in sql if '"LittleLemonAPI_menuitem"' in query]
+        )
+        self.assertEqual(
+            len([query for query in sql if 'cacheversion' in query]), 1
+        )
+
+    def test_unknown_menu_item_is_rejected(self):
+        response = self.client.post(
+            reverse('LittleLemonAPI:cart'),
+            {'menuitem_id': 0, 'quantity': 1}
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('menuitem_id', response.data)
+
+    def test_checkout_prices_lines_without_per_item_queries(self):
+        Cart.objects.bulk_create(
+            Cart(
+                user=self.customer,
+                menuitem=item,
+                quantity=3,
+                unit_price=item.price,
+                price=item.price * 3
+            )
+            for item in self.items
+        )
+        menu_prices.load()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('LittleLemonAPI:orders-list'))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        menu_queries = [
+            query for query in queries
+            if 'FROM "LittleLemonAPI_menuitem"' in query['sql']
+        ]
+        # Only the snapshot's prefetch, however many lines the cart has
+        self.assertEqual(len(menu_queries), 1)
+        order = Order.objects.get(pk=response.data['id'])
+        self.assertEqual(order.orderitem_set.count(), len(self.items))
+        self.assertEqual(
+            order.total,
+            sum(item.price * 3 for item in self.items)
+        )
+
+
+class SQLiteCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = f'{directory.name}/cache.sqlite3'
+        self.cache = self.make_cache()
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_basic_operations(self):
+        self.cache.set('menu', {'items': [1, 2]})
+        self.assertEqual(self.cache.get('menu'), {'items': [1, 2]})
+        self.assertFalse(self.cache.add('menu', 'other'))
+        self.assertTrue(self.cache.add('cart', 1))
+        self.assertEqual(self.cache.incr('cart', 2), 3)
+        self.assertEqual(
+            self.cache.get_many(['menu', 'cart', 'missing']),
+            {'menu': {'items': [1, 2]}, 'cart': 3}
+        )
+        self.assertTrue(self.cache.delete('menu'))
+        self.assertIsNone(self.cache.get('menu'))
+        with self.assertRaises(ValueError):
+            self.cache.incr('menu')
+
+    def test_timeouts_are_per_key(self):
+        self.cache.set('short', 1, timeout=0.05)
+        self.cache.set('long', 2, timeout=60)
+        self.cache.set('forever', 3, timeout=None)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertFalse(self.cache.has_key('short'))
+        self.assertEqual(self.cache.get_many(['long', 'forever']), {
+            'long': 2, 'forever': 3
+        })
+
+    def test_evicts_least_recently_read(self):
+        cache = self.make_cache(MAX_ENTRIES=3, CULL_FREQUENCY=3)
+        with mock.patch('LittleLemonAPI.cache.time') as clock:
+            for now, key in enumerate(['a', 'b', 'c'], start=100):
+                clock.time.return_value = now
+                cache.set(key, key)
+            clock.time.return_value = 110
+            self.assertEqual(cache.get('a'), 'a')
+            clock.time.return_value = 111
+            cache.set('d', 'd')
+        self.assertEqual(
+            cache.get_many(['a', 'b', 'c', 'd']),
+            {'a': 'a', 'c': 'c', 'd': 'd'}
+        )
+
+    def test_shared_between_processes(self):
+        self.cache.set('stale', 1)
+        child = multiprocessing.get_context('fork').Process(
+            target=self.write_from_child
+        )
+        child.start()
+        child.join(10)
+        self.assertEqual(child.exitcode, 0)
+        self.assertEqual(self.cache.get('from-child'), 'hello')
+        self.assertIsNone(self.cache.get('stale'))
+
+    def write_from_child(self):
+        self.cache.set('from-child', 'hello')
+        self.cache.delete('stale')
+
+    def test_benchmark_reports_cross_worker_hits(self):
+        rows = cachebench.run_benchmark(
+            backends=['locmem', 'sqlite'],
+            workers=2,
+            operations=200,
+            keys=20,
+        )
+        by_backend = {row['backend']: row for row in rows}
+        self.assertEqual(by_backend['locmem']['cross_hit_rate'], 0)
+        self.assertGreater(by_backend['sqlite']['cross_hit_rate'], 0)
+        self.assertIn('sqlite', cachebench.format_report(rows))
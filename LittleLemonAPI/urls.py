@@ -5,6 +5,11 @@ app_name = 'LittleLemonAPI'
 
 urlpatterns = [
     path('', views.HomeView.as_view(), name='home'),
+    path(
+        'popular-items/',
+        views.PopularItemsView.as_view(),
+        name='popular-items'
+    ),
     # Menu Items
     path(
         'menu-items/',
@@ -43,9 +48,34 @@ urlpatterns = [
 
     # Orders
     path('orders/', views.OrdersListCreateView.as_view(), name='orders-list'),
+    path(
+        'orders/queue/',
+        views.DeliveryQueueView.as_view(),
+        name='delivery-queue'
+    ),
+    path(
+        'orders/queue/claim/',
+        views.DeliveryClaimView.as_view(),
+        name='delivery-claim'
+    ),
     path(
         'orders/<int:pk>/',
         views.OrderDetailView.as_view(),
         name='order-detail'
     ),
+
+    # Monitoring
+    path(
+        'load-shedding/',
+        views.LoadSheddingStatsView.as_view(),
+        name='load-shedding'
+    ),
+
+    # Profiling
+    path('profiles/', views.ProfileListView.as_view(), name='profiles'),
+    path(
+        'profiles/token/',
+        views.ProfileTokenView.as_view(),
+        name='profile-token'
+    ),
 ]
@@ -0,0 +1,58 @@
+"""
+Version tokens shared by every process, for the in-memory caches.
+
+Each cache (the ``lookups`` tables, the menu price index) remembers the
+token of its source table that it was built from. Signal receivers call
+``bump()`` when the table changes, which stores a fresh random token in
+the database inside the writer's transaction, so every process sees it
+once the change itself is visible. Tokens are random rather than counted,
+so a rolled back write can never bring an old number back.
+
+``current()`` reads all tokens in one query. During a request the result
+is kept for the rest of that request, so caches are checked at most once
+per request; outside requests every call reads the database.
+"""
+import threading
+import uuid
+from contextlib import contextmanager
+
+from .models import CacheVersion
+
+_local = threading.local()
+
+
+def current(name):
+    """The current token of ``name``, or ``None`` if never bumped."""
+    tokens = getattr(_local, 'tokens', None)
+    if tokens is None:
+        tokens = dict(CacheVersion.objects.values_list('name', 'token'))
+        if getattr(_local, 'in_request', False):
+            _local.tokens = tokens
+    return tokens.get(name)
+
+
+def bump(name):
+    CacheVersion.objects.update_or_create(
+        name=name, defaults={'token': uuid.uuid4().hex}
+    )
+    _local.tokens = None
+
+
+def begin_request(**kwargs):
+    _local.in_request = True
+    _local.tokens = None
+
+
+def end_request(**kwargs):
+    _local.in_request = False
+    _local.tokens = None
+
+
+@contextmanager
+def request_scope():
+    """Check versions once for the enclosed block, like a request."""
+    begin_request()
+    try:
+        yield
+    finally:
+        end_request()
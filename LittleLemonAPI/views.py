@@ -1,16 +1,26 @@
-from django.contrib.auth.models import User, Group
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Value
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import generics, status, views
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.filters import OrderingFilter
+from . import loadshedding, popularity
+from .conditional import ConditionalGetMixin, collection_version, make_etag
+from .lookups import get_group, group_members
 from .models import MenuItem, Cart, Order, OrderItem
 from .permissions import IsManager, IsDeliveryCrew, IsCustomer
+from .priceindex import menu_prices
+from .profiling import ProfileStore, issue_token, profiling_setting
 from .serializers import (
     MenuItemSerializer, CartSerializer,
     OrderSerializer, UserSerializer
 )
+from .snapshots import render_order, render_orders, write_snapshot
+from .taskqueue import enqueue
 
 
 # Create your views here.
@@ -19,8 +29,52 @@ class HomeView(views.APIView):
         return Response({"message": "Welcome to the Little Lemon API"})
 
 
+class PopularItemsView(views.APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = request.query_params
+        try:
+            window = int(params.get('window', 7))
+            limit = int(params.get('limit', 10))
+            category = params.get('category')
+            category = int(category) if category else None
+        except ValueError:
+            return Response(
+                {"detail": "window, limit and category must be integers"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_window = popularity.popularity_setting('MAX_WINDOW')
+        top_size = popularity.popularity_setting('TOP_SIZE')
+        if not (1 <= window <= max_window and 1 <= limit <= top_size):
+            return Response(
+                {
+                    "detail": f"window must be 1-{max_window} "
+                              f"and limit 1-{top_size}"
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        ranking = popularity.index.top(window, category, limit)
+        items = MenuItem.objects.in_bulk([pk for pk, _ in ranking])
+        return Response({
+            "window": window,
+            "category": category,
+            "results": [
+                {
+                    "menuitem": MenuItemSerializer(items[pk]).data,
+                    "orders": count,
+                }
+                for pk, count in ranking
+                if pk in items
+            ],
+        })
+
+
 # Menu Items Views
-class MenuItemsListCreateView(generics.ListCreateAPIView):
+class MenuItemsListCreateView(
+    ConditionalGetMixin, generics.ListCreateAPIView
+):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
     filter_backends = [DjangoFilterBackend, OrderingFilter]
@@ -33,6 +87,18 @@ class MenuItemsListCreateView(generics.ListCreateAPIView):
             return [IsManager()]
         return [IsAuthenticated()]
 
+    def get_queryset(self):
+        return self.get_serializer_class().optimize_queryset(
+            super().get_queryset(), self.request
+        )
+
+    def get_validators(self):
+        count, last_modified = collection_version(
+            MenuItem.objects.all(), 'updated_at', 'category__updated_at'
+        )
+        etag = make_etag(self.request, 'menu-items', count, last_modified)
+        return etag, None
+
     def create(self, request, *args, **kwargs):
         # Ensure only Managers can create
         if not IsManager().has_permission(request, self):
@@ -43,7 +109,9 @@ class MenuItemsListCreateView(generics.ListCreateAPIView):
         return super().create(request, *args, **kwargs)
 
 
-class MenuItemDetailView(generics.RetrieveUpdateDestroyAPIView):
+class MenuItemDetailView(
+    ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView
+):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
 
@@ -52,6 +120,24 @@ class MenuItemDetailView(generics.RetrieveUpdateDestroyAPIView):
             return [IsAuthenticated()]
         return [IsManager()]
 
+    def get_queryset(self):
+        return self.get_serializer_class().optimize_queryset(
+            super().get_queryset(), self.request
+        )
+
+    def get_validators(self):
+        stamps = MenuItem.objects.filter(pk=self.kwargs['pk']).values_list(
+            'updated_at', 'category__updated_at'
+        ).first()
+        if stamps is None:
+            # Let retrieve() produce the 404
+            return None, None
+        last_modified = max(stamps)
+        etag = make_etag(
+            self.request, 'menu-item', self.kwargs['pk'], last_modified
+        )
+        return etag, last_modified
+
     def update(self, request, *args, **kwargs):
         if not IsManager().has_permission(request, self):
             return Response(
@@ -75,12 +161,12 @@ class ManagerGroupView(generics.ListCreateAPIView):
     permission_classes = [IsManager]
 
     def get_queryset(self):
-        return User.objects.filter(groups__name='Manager')
+        return group_members('Manager')
 
     def create(self, request, *args, **kwargs):
         user_id = request.data.get('id')
         user = get_object_or_404(User, id=user_id)
-        manager_group = Group.objects.get(name='Manager')
+        manager_group = get_group('Manager')
         manager_group.user_set.add(user)
         return Response(status=status.HTTP_201_CREATED)
 
@@ -91,7 +177,7 @@ class ManagerGroupRemoveView(generics.DestroyAPIView):
     def delete(self, request, *args, **kwargs):
         user_id = kwargs.get('pk')
         user = get_object_or_404(User, id=user_id)
-        manager_group = Group.objects.get(name='Manager')
+        manager_group = get_group('Manager')
         if user.groups.filter(name='Manager').exists():
             manager_group.user_set.remove(user)
             return Response(status=status.HTTP_200)
@@ -106,12 +192,12 @@ class DeliveryCrewGroupView(generics.ListCreateAPIView):
     permission_classes = [IsManager]
 
     def get_queryset(self):
-        return User.objects.filter(groups__name='Delivery crew')
+        return group_members('Delivery crew')
 
     def create(self, request, *args, **kwargs):
         user_id = request.data.get('id')
         user = get_object_or_404(User, id=user_id)
-        delivery_group = Group.objects.get(name='Delivery crew')
+        delivery_group = get_group('Delivery crew')
         delivery_group.user_set.add(user)
         return Response(status=status.HTTP_201_CREATED)
 
@@ -122,7 +208,7 @@ class DeliveryCrewGroupRemoveView(generics.DestroyAPIView):
     def delete(self, request, *args, **kwargs):
         user_id = kwargs.get('pk')
         user = get_object_or_404(User, id=user_id)
-        delivery_group = Group.objects.get(name='Delivery crew')
+        delivery_group = get_group('Delivery crew')
         if user.groups.filter(name='Delivery crew').exists():
             delivery_group.user_set.remove(user)
             return Response(status=status.HTTP_200_OK)
@@ -133,12 +219,28 @@ class DeliveryCrewGroupRemoveView(generics.DestroyAPIView):
 
 
 # Cart Management Views
-class CartView(generics.ListCreateAPIView, generics.DestroyAPIView):
+class CartView(
+    ConditionalGetMixin, generics.ListCreateAPIView, generics.DestroyAPIView
+):
     serializer_class = CartSerializer
     permission_classes = [IsCustomer]
 
     def get_queryset(self):
-        return Cart.objects.filter(user=self.request.user)
+        return self.get_serializer_class().optimize_queryset(
+            Cart.objects.filter(user=self.request.user), self.request
+        )
+
+    def get_validators(self):
+        count, last_modified = collection_version(
+            Cart.objects.filter(user=self.request.user),
+            'updated_at',
+            'menuitem__updated_at',
+            'menuitem__category__updated_at',
+        )
+        etag = make_etag(
+            self.request, 'cart', self.request.user.pk, count, last_modified
+        )
+        return etag, None
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -149,7 +251,31 @@ class CartView(generics.ListCreateAPIView, generics.DestroyAPIView):
 
 
 # Order Management Views
-class OrdersListCreateView(generics.ListCreateAPIView):
+def open_orders():
+    """Unassigned orders not yet delivered, oldest first."""
+    # Value() keeps "status = 0" an equality SQLite can seek on; a bare
+    # False renders as "NOT status", which the composite index cannot use
+    return Order.objects.filter(
+        delivery_crew__isnull=True, status=Value(False)
+    ).order_by('date', 'id')
+
+
+class OrderSnapshotListMixin:
+    """List orders from their snapshots: no joins, no nested serializers."""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        orders = page if page is not None else list(queryset)
+        data = render_orders(orders, request)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+
+class OrdersListCreateView(
+    OrderSnapshotListMixin, generics.ListCreateAPIView
+):
     serializer_class = OrderSerializer
     filter_backends = [DjangoFilterBackend, OrderingFilter]
     filterset_fields = ['status', 'date']
@@ -181,33 +307,101 @@ class OrdersListCreateView(generics.ListCreateAPIView):
 
         # Get cart items for the user
         cart_items = Cart.objects.filter(user=request.user)
-        if not cart_items.exists():
+        lines = list(cart_items)
+        if not lines:
             return Response(
                 {"detail": "Cart is empty"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Calculate total and create order
-        total = sum(item.price for item in cart_items)
-        order = Order.objects.create(user=request.user, total=total)
-
-        # Create order items from cart items
-        for cart_item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                menuitem=cart_item.menuitem,
-                quantity=cart_item.quantity,
-                unit_price=cart_item.unit_price,
-                price=cart_item.price
+        with transaction.atomic():
+            # Price every line from the index in one pass
+            prices = menu_prices.prices(line.menuitem_id for line in lines)
+            order_items = []
+            for line in lines:
+                unit_price = prices.get(line.menuitem_id, line.unit_price)
+                order_items.append(OrderItem(
+                    menuitem_id=line.menuitem_id,
+                    quantity=line.quantity,
+                    unit_price=unit_price,
+                    price=unit_price * line.quantity
+                ))
+
+            # Calculate total and create order
+            total = sum(item.price for item in order_items)
+            order = Order.objects.create(user=request.user, total=total)
+
+            # Create order items from cart items
+            for item in order_items:
+                item.order = order
+            OrderItem.objects.bulk_create(order_items)
+
+            # Side effects run on the task queue after the response
+            enqueue('notify_delivery_crew', order_id=order.id)
+            enqueue(
+                'record_item_orders',
+                day=order.date.isoformat(),
+                items={
+                    str(line.menuitem_id): line.quantity for line in lines
+                },
             )
 
-        # Clear cart
-        cart_items.delete()
-        serializer = self.get_serializer(order)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
+            # Clear cart
+            cart_items.delete()
+            write_snapshot(order)
+
+        return Response(
+            render_order(order, request),
+            status=status.HTTP_201_CREATED
+        )
+
+
+class DeliveryQueueView(OrderSnapshotListMixin, generics.ListAPIView):
+    serializer_class = OrderSerializer
+    permission_classes = [IsDeliveryCrew]
+    filter_backends = []
+
+    def get_queryset(self):
+        return open_orders()
 
 
-class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
+class DeliveryClaimView(views.APIView):
+    permission_classes = [IsDeliveryCrew]
+    # Retries when another courier wins the race for the same order
+    max_attempts = 5
+
+    def post(self, request):
+        for _ in range(self.max_attempts):
+            pk = open_orders().values_list('pk', flat=True).first()
+            if pk is None:
+                return Response(
+                    {"detail": "No open orders"},
+                    status=status.HTTP_404_NOT_FOUND
+                )
+            # The claim and its snapshot commit together, so no read sees
+            # a claimed order whose snapshot has no courier
+            with transaction.atomic():
+                # Only succeeds if the order is still unassigned
+                claimed = open_orders().filter(pk=pk).update(
+                    delivery_crew=request.user,
+                    updated_at=timezone.now()
+                )
+                if claimed:
+                    order = Order.objects.get(pk=pk)
+                    if order.snapshot is not None:
+                        # save() copies the new courier into the snapshot
+                        order.save(update_fields=['snapshot'])
+            if claimed:
+                return Response(render_order(order, request))
+        return Response(
+            {"detail": "Could not claim an order, try again"},
+            status=status.HTTP_409_CONFLICT
+        )
+
+
+class OrderDetailView(
+    ConditionalGetMixin, generics.RetrieveUpdateDestroyAPIView
+):
     serializer_class = OrderSerializer
     queryset = Order.objects.all()
 
@@ -224,11 +418,29 @@ class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
         order = super().get_object()
         if (
             IsCustomer().has_permission(self.request, self)
-            and order.user != self.request.user
+            and order.user_id != self.request.user.pk
         ):
             self.permission_denied(self.request, message="Not your order")
         return order
 
+    def get_validators(self):
+        # Fetched once here and reused by retrieve()
+        self.order = self.get_object()
+        last_modified = self.order.updated_at
+        if self.order.snapshot is None:
+            # Will be rendered from the live menu items
+            _, items_modified = collection_version(
+                OrderItem.objects.filter(order=self.order),
+                'menuitem__updated_at',
+                'menuitem__category__updated_at',
+            )
+            last_modified = max(filter(None, [last_modified, items_modified]))
+        etag = make_etag(self.request, 'order', self.order.pk, last_modified)
+        return etag, last_modified
+
+    def retrieve(self, request, *args, **kwargs):
+        return Response(render_order(self.order, request))
+
     def update(self, request, *args, **kwargs):
         order = self.get_object()
         if IsDeliveryCrew().has_permission(request, self):
@@ -245,7 +457,7 @@ class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
             )
             serializer.is_valid(raise_exception=True)
             serializer.save()
-            return Response(serializer.data)
+            return Response(render_order(serializer.instance, request))
         elif IsManager().has_permission(request, self):
             # Managers can update delivery_crew and status
             serializer = self.get_serializer(
@@ -255,7 +467,7 @@ class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
             )
             serializer.is_valid(raise_exception=True)
             serializer.save()
-            return Response(serializer.data)
+            return Response(render_order(serializer.instance, request))
         return Response(
             {"detail": "Unauthorized"},
             status=status.HTTP_403_FORBIDDEN
@@ -268,3 +480,33 @@ class OrderDetailView(generics.RetrieveUpdateDestroyAPIView):
                 status=status.HTTP_403_FORBIDDEN
             )
         return super().destroy(request, *args, **kwargs)
+
+
+# Profiling Views
+class ProfileTokenView(views.APIView):
+    permission_classes = [IsManager]
+
+    def post(self, request):
+        # Send as X-Profile-Token or ?profile= to profile a request
+        return Response(
+            {
+                "token": issue_token(request.user),
+                "expires_in": profiling_setting('TOKEN_MAX_AGE'),
+            },
+            status=status.HTTP_201_CREATED
+        )
+
+
+class ProfileListView(views.APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(ProfileStore().list())
+
+
+class LoadSheddingStatsView(views.APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        shedder = loadshedding.shedder
+        return Response(shedder.stats() if shedder else {})
@@ -0,0 +1,89 @@
+"""
+Boot-time warm-up for server processes.
+
+``warm_up()`` runs from the WSGI/ASGI entry points, i.e. once per worker,
+or once in the master before forking when the server preloads the app.
+It imports the URLconf, views and serializers, builds every serializer's
+field map, fills the ``lookups`` tables and the menu price index and
+rebuilds the popular items index, so the first requests a worker serves
+do not pay for any of it.
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.urls import get_resolver
+
+logger = logging.getLogger(__name__)
+
+report = {}
+
+
+@contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        report[name] = round((time.perf_counter() - start) * 1000, 3)
+
+
+def build_serializers():
+    from . import serializers
+
+    for value in vars(serializers).values():
+        if (
+            isinstance(value, type)
+            and issubclass(value, serializers.serializers.ModelSerializer)
+            and value.__module__ == serializers.__name__
+        ):
+            # Field maps are per instance, but building one warms the
+            # model metadata and field-mapping caches they all rely on
+            value().fields
+
+
+def warm_up(boot_started=None):
+    """
+    Warm this process up and log how long it took.
+
+    ``boot_started`` is a ``time.perf_counter()`` reading taken before
+    Django was set up; when given, the report also covers the whole boot.
+    """
+    if not settings.WARM_UP_ON_BOOT:
+        return report
+
+    from . import lookups, popularity
+    from .priceindex import menu_prices
+
+    report.clear()
+    start = time.perf_counter()
+    with phase('urls'):
+        get_resolver().url_patterns
+        from . import views  # noqa: F401
+    try:
+        with phase('lookups'):
+            lookups.load()
+        with phase('prices'):
+            menu_prices.load()
+        with phase('serializers'):
+            build_serializers()
+        with phase('popularity'):
+            popularity.index.rebuild()
+    except DatabaseError:
+        logger.warning("Warm-up incomplete: database unavailable")
+    phases = ', '.join(f"{name} {ms:.1f} ms" for name, ms in report.items())
+    now = time.perf_counter()
+    report['total'] = round((now - start) * 1000, 3)
+    if boot_started is not None:
+        report['boot'] = round((now - boot_started) * 1000, 3)
+        logger.info(
+            "Worker booted in %.1f ms, warm-up %.1f ms (%s)",
+            report['boot'], report['total'], phases,
+        )
+    else:
+        logger.info(
+            "Warm-up finished in %.1f ms (%s)", report['total'], phases
+        )
+    return report